@@ -14,7 +14,7 @@ from ..visualization.mycolordict import helpercolors, primarycolors
 class RockstarHMF(object):
     """RockstarHMF class"""
 
-    def __init__(self, paths, labels):
+    def __init__(self, paths, labels, cache=False):
         """Initializing RockstarHMF class and loading rockstar file
 
         Make sure the Rockstar file contains parents ids
@@ -23,6 +23,8 @@ class RockstarHMF(object):
         ----------
         paths : str or array of str
             Path to Rockstar file(s)
+        cache : bool or CatalogCache, optional
+            Load the catalogs through the catalog cache, see Rockstar.load
 
         Examples
         --------
@@ -49,7 +51,7 @@ class RockstarHMF(object):
             self.params[i]['label'] = labels[i]
             self.params[i]['rockstar'] = Rockstar(paths[i])
             self.params[i]['rockstar'].load(
-                only=['mbound_vir'], onlyhosts=False)
+                only=['mbound_vir'], onlyhosts=False, cache=cache)
 
         self.myplot = None
 
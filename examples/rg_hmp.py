@@ -21,7 +21,7 @@ from ..visualization.mycolordict import helpercolors, primarycolors
 class RockstarGadgetHMP(object):
     """RockstarGadgetHMP class"""
 
-    def __init__(self, rockstar_paths, gadget_paths, labels):
+    def __init__(self, rockstar_paths, gadget_paths, labels, cache=False):
         """Constructor of RockstarGadgetHMP class
 
         Parameters
@@ -30,6 +30,8 @@ class RockstarGadgetHMP(object):
             Path to the rockstar output file
         gadget_path : str
             Path to the gadget snapshot
+        cache : bool or CatalogCache, optional
+            Load the catalogs through the catalog cache, see Rockstar.load
 
         Examples
         --------
@@ -70,7 +72,7 @@ class RockstarGadgetHMP(object):
             pointer['rockstar'] = rockstar = Rockstar(rpath)
             rockstar.load(
                 only=['x', 'y', 'z', 'rvir', 'mbound_vir', 'PID'],
-                onlyhosts=False)
+                onlyhosts=False, cache=cache)
             rockstar.halos['x'] *= lratio
             rockstar.halos['y'] *= lratio
             rockstar.halos['z'] *= lratio
@@ -83,7 +85,7 @@ class RockstarGadgetHMP(object):
 
             print('Loading and sorting Gadget snapshot (' + gpath + ')')
             pointer['gadget'] = gadget = Gadget(gpath)
-            gadget.load(sorting=True, col='x')
+            gadget.load(sorting=True, col='morton')
 
     def hmp(self, z=0):
         """Generating halo mass profiles
@@ -104,7 +106,8 @@ class RockstarGadgetHMP(object):
             _input['hmp'] = MyHMP(
                 halos,
                 _input['gadget'].data,
-                float(_input['rockstar'].header['Particle_mass'][0]))
+                float(_input['rockstar'].header['Particle_mass'][0]),
+                index=_input['gadget'].spatialindex)
 
 
             rmin = _input['rockstar'].header['Softening_length'] / 2.0
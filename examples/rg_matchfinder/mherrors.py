@@ -7,10 +7,12 @@ import numpy as np
 from scipy import stats
 from scipy.interpolate import interp1d
 
-from math import sqrt, acos, pi, isnan
+from math import pi, isnan
 
 from ...examples.rg_matchfinder.mh import MatchingHalo
 from ...halofinder.rockstar import Rockstar, NOTAVLBL
+from ...halofinder.asciiparser import fieldnames
+from ...halofinder.binning import binnedstats
 from ...visualization.myplot import MyPlot
 from ...visualization.mycolordict import get
 from ...examples.rg_matchfinder.history.accretionhistory import AccretionHistory
@@ -26,7 +28,7 @@ class MHErrors(object):
     def __init__(self, matchinghalosfile, halos1file, halos2file,
                  lowmasstag='mass1', highmasstag='mass2',
                  lowidtag='id1', highidtag='id2',
-                 lowhalotag='low', highhalotag='high'):
+                 lowhalotag='low', highhalotag='high', lazy=False):
         """Initializing GenerateErrors object
 
         Parameters
@@ -35,6 +37,9 @@ class MHErrors(object):
             path to the matchinghalos ascii file
         halos1file, halos2file : str
             path to the ascii primary and secondary halo files
+        lazy : bool, optional
+            Memory-map the columns of the catalogs from the catalog cache,
+            see Rockstar.load
 
         Examples
         --------
@@ -52,15 +57,21 @@ class MHErrors(object):
         self.halos = {'low': None, 'high': None}
 
         self.halos['low'] = Rockstar(halos1file)
-        self.halos['low'].load()
+        self.halos['low'].load(lazy=lazy)
         self.halos['low'].sortbyid()
 
         self.halos['high'] = Rockstar(halos2file)
-        self.halos['high'].load()
+        self.halos['high'].load(lazy=lazy)
         self.halos['high'].sortbyid()
 
         self.tags = [field[0] for field in self.halos['low'].dtype]
 
+        # Rows of the matching halos in the low and high resolution catalogs
+        lowrows = self.halos['low'].idindex.lookup(self.matches.data['id1'])
+        highrows = self.halos['high'].idindex.lookup(self.matches.data['id2'])
+        found = (lowrows != NOTAVLBL) & (highrows != NOTAVLBL)
+        self.rows = {'low': lowrows[found], 'high': highrows[found]}
+
         self.errors = {}
 
 
@@ -252,7 +263,10 @@ class MHErrors(object):
         ah = AccretionHistory(fp)
         ah.removecorrupteddata()
 
-        low = self.halos['low'].halossortedbyid
+        rows = self.halos['low'].idindex.lookup(
+            ah.cleanedhistory['id' + str(res)])
+        history = ah.cleanedhistory[rows != NOTAVLBL]
+        num_p_low = self.halos['low'].halos['num_p'][rows[rows != NOTAVLBL]]
 
         def conv2a(redshift):
             """Converting redshift to scale factor"""
@@ -261,19 +275,14 @@ class MHErrors(object):
         for zz in ['30', '50', '70']:
             print('Plotting accretion history of a_' + zz)
 
-            err = {'acc_hist_err': [], 'num_p_low': []}
-
             zlow = 'z' + zz + str(res)
             zhigh = 'z' + zz + '1024'
 
-            for history in ah.cleanedhistory:
-                # Filling the output dictionary
-                err['num_p_low'].append(
-                    low[history['id' + str(res)]]['num_p'])
-
-                err['acc_hist_err'].append(
-                    (conv2a(history[zlow]) - conv2a(history[zhigh]))
-                    / conv2a(history[zhigh]))
+            err = {
+                'num_p_low': num_p_low,
+                'acc_hist_err': (conv2a(history[zlow]) - conv2a(history[zhigh]))
+                                / conv2a(history[zhigh])
+            }
 
             # ymin = -1 * np.percentile(
             #     -1 * np.array(err['acc_hist_err']), 99.5) * 1.5
@@ -355,40 +364,25 @@ class MHErrors(object):
         """Calculating a soften version of num_p for low and high resolution
         runs
         """
-        vs = []
-
-        low = self.halos['low'].halossortedbyid
-        high = self.halos['high'].halossortedbyid
-
-        for id1, id2 in zip(self.matches.data['id1'], self.matches.data['id2']):
-            # Checking the availability of the data
-            if id1 is NOTAVLBL or id2 is NOTAVLBL: continue
-            vs.append((low[id1]['num_p'], high[id2]['num_p']))
+        num_p_low, num_p_high = self._matchedcolumn('num_p')
 
-        vs = np.array(vs, dtype=[('num_p_low', np.float64),
-                                ('num_p_high', np.float64)])
-        vs = np.sort(vs, order='num_p_low')
+        order = np.argsort(num_p_low, kind='mergesort')
+        vs = {'num_p_low': num_p_low[order].astype(np.float64),
+              'num_p_high': num_p_high[order].astype(np.float64)}
 
         if nbins is None or not isinstance(nbins, int):
             return  vs['num_p_low'], vs['num_p_high']
         else:
-            xs, ys = [], []
             bins = np.logspace(np.log10(vs['num_p_low'][0]),
                                np.log10(vs['num_p_low'][-1]),
                                num=21, base=10)
 
-            for bmin, bmax in zip(bins[:-1], bins[1:]):
-                i_min = np.searchsorted(vs['num_p_low'], bmin, side='right')
-                i_max = np.searchsorted(vs['num_p_low'], bmax, side='right')
+            stats = binnedstats(vs['num_p_low'], vs['num_p_high'], bins)
+            nonempty = stats['count'] > 0
 
-                values = vs['num_p_high'][i_min:i_max]
+            xs = np.sqrt(bins[:-1] * bins[1:])[nonempty]
 
-                if len(values) == 0: continue
-
-                xs.append(10**(np.log10(bmin * bmax) / 2))
-                ys.append(sum(values) / len(values))
-
-            return xs, ys
+            return list(xs), list(stats['mean'][nonempty])
 
 
     def _generrors(self, prop):
@@ -402,24 +396,18 @@ class MHErrors(object):
             A specific property of halos provided by rockstar, e.g. mvir, rvir
         """
 
-        if prop not in self.tags: raise KeyError
-
-        output = {prop + '_err': [], 'num_p_low': []}
+        # Fields are named without the brackets of tags like b_to_a(500c)
+        name = fieldnames([prop])[0]
+        if name not in self.tags: raise KeyError
 
-        low = self.halos['low'].halossortedbyid
-        high = self.halos['high'].halossortedbyid
+        low, high = self._matchedcolumn(name)
+        num_p_low = self._matchedcolumn('num_p')[0]
 
-        for id1, id2 in zip(self.matches.data['id1'], self.matches.data['id2']):
-            # Checking the availability of the data
-            if id1 is NOTAVLBL or id2 is NOTAVLBL: continue
-            if high[id2][prop] == 0: continue
+        keep = high != 0
+        low, high = low[keep], high[keep].astype(np.float64)
 
-            # Filling the output dictionary
-            output['num_p_low'].append(low[id1]['num_p'])
-            output[prop + '_err'].append(
-                (low[id1][prop] - high[id2][prop]) / float(high[id2][prop]))
-
-        return output
+        return {'num_p_low': num_p_low[keep],
+                prop + '_err': (low - high) / high}
 
 
     def _genvectorerr(self, props):
@@ -433,89 +421,77 @@ class MHErrors(object):
             The length of the list should be 3
         """
 
-        if(props[0] and props[1] and props[2]) not in self.tags: raise KeyError
-
-        output = {'modulus_err': [], 'angle_err': [], 'num_p_low': []}
+        if any(prop not in self.tags for prop in props): raise KeyError
 
-        low = self.halos['low'].halossortedbyid
-        high = self.halos['high'].halossortedbyid
+        low = np.array([self._matchedcolumn(prop)[0] for prop in props],
+                       dtype=np.float64)
+        high = np.array([self._matchedcolumn(prop)[1] for prop in props],
+                        dtype=np.float64)
 
-        for id1, id2 in zip(self.matches.data['id1'], self.matches.data['id2']):
-            # Checking the availability of the data
-            if id1 is NOTAVLBL or id2 is NOTAVLBL: continue
+        v1dotv2 = np.sum(low * high, axis=0)
+        v1 = np.sqrt(np.sum(low**2, axis=0))
+        v2 = np.sqrt(np.sum(high**2, axis=0))
 
-            v1dotv2 = low[id1][props[0]] * high[id2][props[0]] + \
-                      low[id1][props[1]] * high[id2][props[1]] + \
-                      low[id1][props[2]] * high[id2][props[2]]
+        keep = (v1 != 0) & (v2 != 0)
 
-            v1 = sqrt(low[id1][props[0]]**2 +
-                      low[id1][props[1]]**2 +
-                      low[id1][props[2]]**2)
-
-            v2 = sqrt(high[id2][props[0]]**2 +
-                      high[id2][props[1]]**2 +
-                      high[id2][props[2]]**2)
-
-            if v1 == 0 or v2 == 0: continue
-
-            # Filling the output dictionary
-            output['num_p_low'].append(low[id1]['num_p'])
-            output['modulus_err'].append(sqrt(
-                (low[id1][props[0]] - high[id2][props[0]])**2 +
-                (low[id1][props[1]] - high[id2][props[1]])**2 +
-                (low[id1][props[2]] - high[id2][props[2]])**2))
-
-            output['angle_err'].append(acos(v1dotv2 / (v1 * v2)))
-
-        return output
+        return {
+            'num_p_low': self._matchedcolumn('num_p')[0][keep],
+            'modulus_err': np.sqrt(np.sum((low - high)**2, axis=0))[keep],
+            'angle_err': np.arccos(np.clip(
+                v1dotv2[keep] / (v1[keep] * v2[keep]), -1, 1))
+        }
 
 
     def _genangmag(self):
         """Generating the uncertainty in the angular magnitude"""
 
-        low = self.halos['low'].halossortedbyid
-        high = self.halos['high'].halossortedbyid
+        low = np.array([self._matchedcolumn(j)[0] for j in ['Jx', 'Jy', 'Jz']],
+                       dtype=np.float64)
+        high = np.array([self._matchedcolumn(j)[1] for j in ['Jx', 'Jy', 'Jz']],
+                        dtype=np.float64)
 
-        output = {'num_p_low': [], 'ang_mag_err': []}
+        j1 = np.sqrt(np.sum(low**2, axis=0))
+        j2 = np.sqrt(np.sum(high**2, axis=0))
 
-        for id1, id2 in zip(self.matches.data['id1'], self.matches.data['id2']):
-            # Checking the availability of the data
-            if id1 is NOTAVLBL or id2 is NOTAVLBL: continue
+        nonzero = j2 != 0
 
-            output['num_p_low'].append(low[id1]['num_p'])
-            j1 = sqrt(low[id1]['Jx']**2 + low[id1]['Jy']**2 + low[id1]['Jz']**2)
-            j2 = sqrt(high[id2]['Jx']**2 + high[id2]['Jy']**2
-                      + high[id2]['Jz']**2)
-
-            if j2 != 0:
-                output['ang_mag_err'].append((j1 - j2) / j2)
-            else:
-                output['ang_mag_err'].append(output['ang_mag_err'][-1] * 10)
+        ang_mag_err = np.empty(len(j1))
+        ang_mag_err[nonzero] = (j1[nonzero] - j2[nonzero]) / j2[nonzero]
 
+        # Halos without angular momentum get 10 times the previous error,
+        # or NaN when there is no previous halo
+        for i in np.flatnonzero(~nonzero):
+            ang_mag_err[i] = ang_mag_err[i - 1] * 10 if i > 0 else np.nan
 
-        return output
+        return {'num_p_low': self._matchedcolumn('num_p')[0],
+                'ang_mag_err': ang_mag_err}
 
 
     def _genconcentration(self):
         """Generating concentration parameter, c"""
-        output = {'c_err': [], 'num_p_low': []}
+        rs_low, rs_high = self._matchedcolumn('Rs')
+        rvir_low, rvir_high = self._matchedcolumn('rvir')
+
+        keep = (rs_low != 0) & (rs_high != 0) & (rvir_high != 0)
 
-        low = self.halos['low'].halossortedbyid
-        high = self.halos['high'].halossortedbyid
+        c_high = rvir_high[keep] / rs_high[keep].astype(np.float64)
+        c_low = rvir_low[keep] / rs_low[keep].astype(np.float64)
 
-        for id1, id2 in zip(self.matches.data['id1'], self.matches.data['id2']):
-            # Checking the availability of the data
-            if id1 is NOTAVLBL or id2 is NOTAVLBL: continue
-            if low[id1]['Rs'] == 0 or high[id2]['Rs'] == 0: continue
-            if high[id2]['rvir'] == 0: continue
+        return {'num_p_low': self._matchedcolumn('num_p')[0][keep],
+                'c_err': (c_low - c_high) / c_high}
 
-            c_high = high[id2]['rvir'] / high[id2]['Rs']
-            c_low = low[id1]['rvir'] / low[id1]['Rs']
 
-            output['num_p_low'].append(low[id1]['num_p'])
-            output['c_err'].append((c_low - c_high) / c_high)
+    def _matchedcolumn(self, tag):
+        """Values of a given column for the matching halos
+
+        Returns
+        -------
+        low, high : numpy.ndarray
+            Values of the low and high resolution halos of each match
+        """
 
-        return output
+        return (self.halos['low'].halos[tag][self.rows['low']],
+                self.halos['high'].halos[tag][self.rows['high']])
 
 
     def _plot(self, num_p, err, ymin, ymax, ylabel, path, confactor=None,
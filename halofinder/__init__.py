@@ -1,3 +1,13 @@
 """Halofinder"""
 
-__all__ = ['rockstar']
+__all__ = ['rockstar',
+           'asciiparser',
+           'catalogcache',
+           'columnarcatalog',
+           'binning',
+           'idindex',
+           'rockstarbin',
+           'spatialindex',
+           'hierarchy',
+           'streaming',
+           'rockstarseries']
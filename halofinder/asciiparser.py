@@ -0,0 +1,405 @@
+"""asciiparser.py
+Parsing large, whitespace separated ascii tables (e.g. Rockstar halo files)
+by splitting them into byte ranges on line boundaries and parsing the ranges
+in parallel
+"""
+
+import os
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+
+CHUNKSIZE = 32 * 1024**2 # Bytes per parsed range
+CASTRTOL = 1e-6 # Relative error allowed when narrowing float columns
+
+# Characters removed from column tags and names suffixed with an underscore
+# in field names, as numpy.genfromtxt does
+DELETECHARS = set('~!@#$%^&*()-=+~\\|]}[{\';: /?.>,<"')
+EXCLUDEDNAMES = ['return', 'file', 'print']
+
+
+def fieldnames(tags):
+    """Field names of columns, validated the way numpy.genfromtxt names the
+    fields of its output, e.g. 'A[x]' is 'Ax' and 'T/|U|' is 'TU'
+
+    Parameters
+    ----------
+    tags : list of str
+        Column tags
+
+    Returns
+    -------
+    list of str
+    """
+
+    names, seen, nempty = [], {}, 0
+
+    for tag in tags:
+        name = ''.join(c for c in tag.replace(' ', '_')
+                       if c not in DELETECHARS)
+
+        if name == '':
+            name = 'f%d' % nempty
+            while name in tags:
+                nempty += 1
+                name = 'f%d' % nempty
+            nempty += 1
+        elif name in EXCLUDEDNAMES:
+            name += '_'
+
+        count = seen.get(name, 0)
+        names.append(name if count == 0 else '%s_%d' % (name, count))
+        seen[name] = count + 1
+
+    return names
+
+
+def parseascii(path, dtype, usecols, ncols, skip_header=0, where=None,
+               nprocs=None, chunksize=CHUNKSIZE, blocktag=None):
+    """Parsing an ascii table into a structured array
+
+    Parameters
+    ----------
+    path : str or list of str
+        Path to the ascii file, or to several files with the same columns
+        (e.g. blocks of a Rockstar catalog) parsed into one array
+    dtype : list of (str, numpy.dtype)
+        Datatype of the output array, one field per used column (plus
+        blocktag)
+    usecols : list of int
+        Indices of the columns to keep, in the same order as dtype
+    ncols : int
+        Total number of columns in each row of the file
+    skip_header : int, optional
+        Number of lines to skip at the beginning of the file. Comment lines
+        (starting with #) right after the skipped lines are skipped too
+    where : dict, optional
+        Filters applied to each parsed range before keeping its rows, mapping
+        a column index to either a value (equality) or a (min, max) tuple
+        (both inclusive, None for an open end). Filtered columns don't need
+        to be in usecols
+    nprocs : int, optional
+        Number of worker processes, default is the number of cpus
+    chunksize : int, optional
+        Approximate size of each parsed byte range
+    blocktag : str, optional
+        A field of dtype (after the used columns) to fill with the index of
+        the file each row comes from
+
+    Returns
+    -------
+    numpy.ndarray
+
+    Notes
+    -----
+    Values are read as float64 and then cast to the requested types, so
+    integer columns are exact up to 2**53. Casts to narrower types (e.g.
+    float32 or int32) are checked with castcolumn.
+
+    Examples
+    --------
+    >>> halos = parseascii('/path/to/halos_0.0.ascii',
+    ...                    [('id', int), ('mvir', float)], [0, 2], 55,
+    ...                    skip_header=19, where={55: -1})
+    """
+
+    jobs = _jobs(path, dtype, usecols, ncols, skip_header, where, chunksize,
+                 blocktag)
+
+    pool = Pool(nprocs) if len(jobs) > 1 and nprocs != 1 else None
+
+    try:
+        _imap = pool.imap if pool is not None else map
+
+        if where:
+            # The number of accepted rows is unknown before parsing, but the
+            # filtered ranges are usually small
+            chunks = list(_imap(_parserange, jobs))
+            halos = np.concatenate(chunks) if chunks \
+                    else np.empty(0, dtype=dtype)
+        else:
+            # Each range is read once, into an array sized from the average
+            # size of the first rows of each file
+            halos = _fill(_imap(_parserange, jobs), dtype,
+                          _estimaterows(jobs, skip_header))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return halos
+
+
+def iterascii(path, dtype, usecols, ncols, skip_header=0, where=None,
+              nprocs=None, chunksize=CHUNKSIZE, blocktag=None):
+    """Parsing an ascii table chunk by chunk, in the order of the rows
+
+    Same parameters as parseascii. At most 2 * nprocs chunks are parsed
+    ahead of the consumer, so the memory use doesn't depend on the size of
+    the table.
+
+    Yields
+    ------
+    numpy.ndarray
+        Parsed (and filtered) rows of each byte range
+
+    Examples
+    --------
+    >>> for chunk in iterascii('/path/to/halos_0.0.ascii',
+    ...                        [('mvir', float)], [2], 55, skip_header=19):
+    ...     hist += np.histogram(chunk['mvir'], bins=edges)[0]
+    """
+
+    jobs = _jobs(path, dtype, usecols, ncols, skip_header, where, chunksize,
+                 blocktag)
+
+    if len(jobs) < 2 or nprocs == 1:
+        for job in jobs:
+            yield _parserange(job)
+        return
+
+    nprocs = nprocs or cpu_count()
+    window = 2 * nprocs
+    pool = Pool(nprocs)
+
+    try:
+        for begin in range(0, len(jobs), window):
+            for chunk in pool.imap(_parserange, jobs[begin:begin + window]):
+                yield chunk
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def rowbytes(path, skip_header=0, sample=64 * 1024):
+    """Average size of the rows of an ascii table in bytes, estimated from
+    its first rows"""
+
+    with open(path, 'rb') as _file:
+        _file.seek(_datastart(path, skip_header))
+        text = _file.read(sample)
+
+    return max(len(text) // max(text.count(b'\n'), 1), 1)
+
+
+def _jobs(path, dtype, usecols, ncols, skip_header, where, chunksize,
+          blocktag):
+    """Splitting one or several files into parsing jobs, see _parserange"""
+
+    paths = [path] if isinstance(path, str) else path
+    where = sorted(where.items()) if where else []
+
+    # Ranges of all the files are parsed by the same pool
+    jobs = []
+    for block, _path in enumerate(paths):
+        begin = _datastart(_path, skip_header)
+        jobs.extend((_path, b, e, ncols, usecols, dtype, where, blocktag,
+                     block) for (b, e) in _lineranges(_path, begin, chunksize))
+
+    return jobs
+
+
+def _fill(chunks, dtype, nrows):
+    """Copying parsed chunks into a preallocated array, growing it when
+    there are more rows than estimated
+
+    Parameters
+    ----------
+    chunks : iterable of numpy.ndarray
+        Parsed ranges
+    dtype : list of (str, numpy.dtype)
+    nrows : int
+        Estimated number of rows
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    halos = np.empty(nrows, dtype=dtype)
+
+    filled = 0
+    for chunk in chunks:
+        if filled + len(chunk) > len(halos):
+            grown = np.empty(max(filled + len(chunk), len(halos) * 5 // 4),
+                             dtype=dtype)
+            grown[:filled] = halos[:filled]
+            halos = grown
+
+        halos[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+
+    # The pages of the unused rows are never touched
+    return halos if filled == len(halos) else halos[:filled]
+
+
+def _estimaterows(jobs, skip_header):
+    """Estimating the number of rows of the ranges of jobs from the average
+    size of the first rows of their files"""
+
+    nbytes = {}
+    for job in jobs:
+        nbytes[job[0]] = nbytes.get(job[0], 0) + job[2] - job[1]
+
+    # rowbytes rounds down, which rather overestimates the rows
+    return sum(size // rowbytes(path, skip_header) + 1
+               for path, size in nbytes.items())
+
+
+def _datastart(path, skip_header):
+    """Finding the byte offset of the first data line"""
+
+    with open(path, 'rb') as _file:
+        for _ in range(skip_header):
+            _file.readline()
+
+        while True:
+            offset = _file.tell()
+            line = _file.readline()
+            if not line.startswith(b'#'):
+                return offset
+
+
+def _lineranges(path, begin, chunksize):
+    """Splitting a file into byte ranges ending on line boundaries
+
+    Returns
+    -------
+    list of (int, int)
+        (begin, end) byte offsets of each range
+    """
+
+    end = os.path.getsize(path)
+    bounds = [begin]
+
+    with open(path, 'rb') as _file:
+        while bounds[-1] + chunksize < end:
+            _file.seek(bounds[-1] + chunksize)
+            _file.readline()
+            if _file.tell() >= end:
+                break
+            bounds.append(_file.tell())
+
+    bounds.append(end)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _readrange(path, begin, end):
+    """Reading the raw bytes of a range"""
+
+    with open(path, 'rb') as _file:
+        _file.seek(begin)
+        return _file.read(end - begin)
+
+
+def _parserange(job):
+    """Parsing a range into a structured array
+
+    Parameters
+    ----------
+    job : tuple
+        (path, begin, end, ncols, usecols, dtype, where, blocktag, block)
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    path, begin, end, ncols, usecols, dtype, where, blocktag, block = job
+
+    values = np.fromstring(_readrange(path, begin, end), sep=' ')
+
+    if values.size % ncols != 0:
+        raise ValueError('Inconsistent number of columns in bytes %d-%d of %s'
+                         % (begin, end, path))
+
+    values = values.reshape(-1, ncols)
+
+    if where:
+        values = values[wheremask(
+            dict((col, values[:, col]) for col, _ in where), where)]
+
+    chunk = np.empty(len(values), dtype=dtype)
+    for (tag, _), col in zip(dtype, usecols):
+        castcolumn(chunk, tag, values[:, col])
+
+    if blocktag is not None:
+        chunk[blocktag] = block
+
+    return chunk
+
+
+def castcolumn(output, tag, values, rtol=CASTRTOL):
+    """Copying values into a column of a structured array, checking that
+    narrowing conversions don't overflow or lose precision
+
+    Parameters
+    ----------
+    output : numpy.ndarray
+        Structured array
+    tag : str
+        Field of output
+    values : numpy.ndarray
+    rtol : float, optional
+        Largest relative error allowed when converting to a narrower float
+
+    Raises
+    ------
+    ValueError
+        If a value doesn't fit into the type of the column
+    """
+
+    target = output.dtype[tag]
+    if target.itemsize >= values.dtype.itemsize or len(values) == 0:
+        output[tag] = values
+        return
+
+    if target.kind in 'iu':
+        info = np.iinfo(target)
+        if np.min(values) < info.min or np.max(values) > info.max:
+            raise ValueError('Values of %s overflow %s' % (tag, target))
+
+    output[tag] = values
+
+    if target.kind == 'f':
+        with np.errstate(invalid='ignore', over='ignore'):
+            error = np.abs(output[tag] - values) > rtol * np.abs(values)
+        if np.any(error):
+            raise ValueError('Values of %s lose precision (rtol %g) as %s'
+                             % (tag, rtol, target))
+
+
+def wheremask(columns, where):
+    """Generating the mask of rows passing all the filters
+
+    Parameters
+    ----------
+    columns : numpy.ndarray or dict
+        Anything returning the column array of each key of where, e.g. a
+        structured array
+    where : list of (key, value or (min, max))
+
+    Returns
+    -------
+    numpy.ndarray of bool
+    """
+
+    mask = None
+
+    for key, cond in where:
+        column = columns[key]
+        if mask is None:
+            mask = np.ones(len(column), dtype=bool)
+
+        if isinstance(cond, (tuple, list)):
+            minval, maxval = cond
+            if minval is not None:
+                mask &= column >= minval
+            if maxval is not None:
+                mask &= column <= maxval
+        else:
+            mask &= column == cond
+
+    return mask
@@ -0,0 +1,104 @@
+"""asciiparser_test.py
+Checking the parallel ascii parser against numpy.genfromtxt
+"""
+
+import numpy as np
+import pytest
+
+from .asciiparser import iterascii, parseascii
+
+
+NCOLS = 5
+HEADER = 3
+DTYPE = [('id', np.int64), ('mvir', np.float64), ('pid', np.int64)]
+USECOLS = [0, 2, 4]
+
+
+def _writetable(path, nrows, seed):
+    """An ascii table with a header, a comment and NCOLS columns"""
+
+    rng = np.random.RandomState(seed)
+    table = np.column_stack((np.arange(nrows), rng.random_sample(nrows),
+                             rng.random_sample(nrows) * 1e12,
+                             rng.randint(-5, 5, nrows),
+                             rng.choice([-1, 3, 7], nrows)))
+
+    with open(str(path), 'w') as _file:
+        _file.write('head\n' * HEADER + '#comment\n')
+        for row in table:
+            _file.write('%d %.6e %.8e %d %d\n' % tuple(row))
+
+    return np.genfromtxt(str(path), skip_header=HEADER)
+
+
+@pytest.mark.parametrize('nprocs', [1, 2])
+@pytest.mark.parametrize('chunksize', [64, 1000, 10**6])
+def test_parseascii(tmp_path, nprocs, chunksize):
+    path = tmp_path / 'halos.ascii'
+    expected = _writetable(path, 500, 0)
+
+    halos = parseascii(str(path), DTYPE, USECOLS, NCOLS,
+                       skip_header=HEADER, nprocs=nprocs,
+                       chunksize=chunksize)
+
+    assert halos.dtype == np.dtype(DTYPE)
+    for (tag, _), col in zip(DTYPE, USECOLS):
+        np.testing.assert_array_equal(halos[tag], expected[:, col])
+
+
+def test_parseascii_where(tmp_path):
+    path = tmp_path / 'halos.ascii'
+    expected = _writetable(path, 500, 1)
+
+    halos = parseascii(str(path), DTYPE, USECOLS, NCOLS,
+                       skip_header=HEADER, chunksize=256,
+                       where={4: -1, 3: (0, None)})
+
+    keep = (expected[:, 4] == -1) & (expected[:, 3] >= 0)
+    np.testing.assert_array_equal(halos['id'], expected[keep, 0])
+
+
+def test_parseascii_blocks(tmp_path):
+    paths = [tmp_path / 'halos.0.ascii', tmp_path / 'halos.1.ascii']
+    expected = [_writetable(p, n, i) for i, (p, n) in
+                enumerate(zip(paths, [300, 7]))]
+
+    halos = parseascii([str(p) for p in paths],
+                       DTYPE + [('block', np.int16)], USECOLS, NCOLS,
+                       skip_header=HEADER, chunksize=512, blocktag='block')
+
+    np.testing.assert_array_equal(
+        halos['mvir'], np.concatenate([e[:, 2] for e in expected]))
+    np.testing.assert_array_equal(halos['block'], [0] * 300 + [1] * 7)
+
+
+def test_iterascii(tmp_path):
+    path = tmp_path / 'halos.ascii'
+    expected = _writetable(path, 500, 2)
+
+    chunks = list(iterascii(str(path), DTYPE, USECOLS, NCOLS,
+                            skip_header=HEADER, nprocs=2, chunksize=128))
+
+    assert len(chunks) > 1
+    np.testing.assert_array_equal(np.concatenate(chunks)['pid'],
+                                  expected[:, 4])
+
+
+def test_parseascii_growing(tmp_path):
+    """Short first rows underestimate the number of rows"""
+
+    path = tmp_path / 'halos.ascii'
+    ids = np.arange(20000)
+
+    with open(str(path), 'w') as _file:
+        _file.write('head\n' * HEADER)
+        for i in ids:
+            _file.write('%d 1 2 3 4\n' % i if i < 5000 else
+                        '%d 1.000000 2.000000 3.000000 4.000000\n' % i)
+        _file.write('\n')
+
+    halos = parseascii(str(path), DTYPE, USECOLS, NCOLS,
+                       skip_header=HEADER, nprocs=1, chunksize=4096)
+
+    np.testing.assert_array_equal(halos['id'], ids)
+    np.testing.assert_array_equal(halos['pid'], np.full(len(ids), 4))
@@ -0,0 +1,229 @@
+"""binning.py
+Vectorised binning of halos on one or several properties at once
+"""
+
+import numpy as np
+
+
+# Distance to an edge, in bins, below which a value computed from evenly
+# spaced edges is checked against the edges themselves
+EDGETOL = 1e-6
+
+
+class HaloBins(object):
+    """Binning halos with a single sorting pass
+
+    Halos are assigned to bins with edges[i] < value <= edges[i + 1]. The
+    result is a permutation which groups the halos of each bin together and
+    the offsets of each bin in that permutation.
+
+    Parameters
+    ----------
+    values : list of numpy.ndarray
+        One array of values per binned property
+    edges : list of array of float
+        One array of bin edges per binned property
+
+    Attributes
+    ----------
+    self.shape : tuple of int
+        Number of bins along each property
+    self.perm : numpy.ndarray
+        Permutation sorting halos by their (flattened) bin index. Halos
+        outside of the bins come last
+    self.offsets : numpy.ndarray
+        Halos of the flattened bin i are self.perm[offsets[i]:offsets[i+1]]
+
+    Examples
+    --------
+    >>> from mytools.halofinder.binning import HaloBins
+    >>> bins = HaloBins([halos['mvir'], halos['Spin']],
+    ...                 [np.logspace(10, 15, num=11), np.linspace(0, .2, 5)])
+    >>> halos[bins.indices((3, 2))]
+    """
+
+    def __init__(self, values, edges):
+        """Constructor for HaloBins class"""
+
+        self.edges = [np.asarray(e) for e in edges]
+        self.shape = tuple(len(e) - 1 for e in self.edges)
+        self.nbins = int(np.prod(self.shape))
+
+        flat = np.zeros(len(values[0]), dtype=np.intp)
+        inside = np.ones(len(values[0]), dtype=bool)
+
+        for value, edge, nbins in zip(values, self.edges, self.shape):
+            idx = binindex(value, edge)
+            inside &= idx >= 0
+            flat = flat * nbins + idx
+
+        # Halos outside of the bins are collected in an extra, last bin
+        flat[~inside] = self.nbins
+
+        counts = np.bincount(flat, minlength=self.nbins + 1)
+
+        self.perm = np.argsort(flat, kind='mergesort')
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.counts = counts[:-1].reshape(self.shape)
+
+    def indices(self, idx):
+        """Indices of the halos in a given bin (a view of self.perm)
+
+        Parameters
+        ----------
+        idx : int or tuple of int
+            Index of the bin
+        """
+
+        i = np.ravel_multi_index(np.atleast_1d(idx), self.shape)
+        return self.perm[self.offsets[i]:self.offsets[i + 1]]
+
+    def inside(self):
+        """Indices of all halos inside the bins, grouped by bin"""
+
+        return self.perm[:self.offsets[-2]]
+
+
+def binindex(values, edges):
+    """Index of the bin of each value, edges[i] < value <= edges[i + 1]
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+    edges : numpy.ndarray
+        Sorted bin edges
+
+    Returns
+    -------
+    numpy.ndarray of int
+        Bin indices, -1 for values outside of the bins
+    """
+
+    values, edges = np.asarray(values), np.asarray(edges)
+    nbins = len(edges) - 1
+    spacing = _spacing(edges)
+
+    if spacing is None:
+        idx = np.searchsorted(edges, values, side='left') - 1
+        idx[(idx < 0) | (idx >= nbins)] = -1
+        return idx
+
+    # Evenly (linear or log) spaced edges: computing the indices directly,
+    # which is much faster than a binary search, and fixing the rounding
+    # errors next to the edges
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if spacing == 'log':
+            pos = (np.log10(values) - np.log10(edges[0])) \
+                  / np.log10(edges[1] / edges[0])
+        else:
+            pos = (values - edges[0]) / (edges[1] - edges[0])
+
+    # fmax and fmin send NaN to the first bin, masked out below
+    np.fmin(np.fmax(pos, 0, out=pos), nbins - 1, out=pos)
+    idx = pos.astype(np.intp)
+
+    # Only the values next to an edge may be off by one bin, comparing them
+    # with the edges instead of the whole array
+    frac = pos - idx
+    near = np.flatnonzero((frac < EDGETOL) | (frac > 1 - EDGETOL))
+    nearidx = idx[near]
+    nearidx -= values[near] <= edges[nearidx]
+    nearidx += values[near] > edges[nearidx + 1]
+    idx[near] = nearidx
+
+    idx[~((values > edges[0]) & (values <= edges[-1]))] = -1
+
+    return idx
+
+
+def _spacing(edges):
+    """Checking whether bin edges are linearly or logarithmically spaced
+
+    Returns
+    -------
+    str or None
+        'linear', 'log' or None
+    """
+
+    if len(edges) < 3:
+        return None
+
+    if np.allclose(np.diff(edges), edges[1] - edges[0], rtol=1e-6, atol=0):
+        return 'linear'
+
+    if edges[0] > 0:
+        logedges = np.log10(edges)
+        if np.allclose(np.diff(logedges), logedges[1] - logedges[0],
+                       rtol=1e-6, atol=0):
+            return 'log'
+
+    return None
+
+
+def binnedstats(x, y, edges, percentiles=()):
+    """Statistics of y in bins of x, edges[i] < x <= edges[i + 1]
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+    edges : array of float
+        Sorted bin edges of x
+    percentiles : list of float, optional
+        Percentiles (between 0 and 100) to compute in each bin
+
+    Returns
+    -------
+    dict
+        'count', 'mean', 'std', 'median' arrays with one element per bin and
+        'percentiles', an array of shape (nbins, len(percentiles)). Empty
+        bins are NaN
+
+    Examples
+    --------
+    >>> stats = binnedstats(halos['mvir'], halos['num_p'],
+    ...                     np.logspace(10, 15, num=21),
+    ...                     percentiles=[15.9, 84.1])
+    """
+
+    nbins = len(edges) - 1
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+
+    # Values outside of the bins are collected in an extra, last bin
+    idx = binindex(x, edges)
+    idx[idx < 0] = nbins
+
+    count = np.bincount(idx, minlength=nbins + 1)[:-1]
+    nonempty = count > 0
+    offsets = np.concatenate(([0], np.cumsum(count)))
+
+    # Grouping y by bin (a stable sort on small integers is a radix sort),
+    # dropping the values outside of the bins
+    idxtype = np.int16 if nbins < np.iinfo(np.int16).max else np.intp
+    order = np.argsort(idx.astype(idxtype), kind='stable')[:offsets[-1]]
+    grouped = y[order]
+
+    mean = np.full(nbins, np.nan)
+    std = np.full(nbins, np.nan)
+    qs = [50] + list(percentiles)
+    values = np.full((nbins, len(qs)), np.nan)
+
+    if len(grouped) > 0:
+        # Grouped values of consecutive non-empty bins are contiguous
+        starts = offsets[:-1][nonempty]
+        mean[nonempty] = np.add.reduceat(grouped, starts) / count[nonempty]
+        deviation = grouped - np.repeat(mean[nonempty], count[nonempty])
+        deviation *= deviation
+        std[nonempty] = np.sqrt(np.add.reduceat(deviation, starts)
+                                / count[nonempty])
+
+    for i in np.flatnonzero(nonempty):
+        values[i] = np.percentile(grouped[offsets[i]:offsets[i + 1]], qs,
+                                  overwrite_input=True)
+
+    return {
+        'count': count,
+        'mean': mean,
+        'std': std,
+        'median': values[:, 0],
+        'percentiles': values[:, 1:]
+    }
@@ -0,0 +1,104 @@
+"""binning_test.py
+Checking the vectorised binning against a brute force one
+"""
+
+import numpy as np
+import pytest
+
+from .binning import HaloBins, binindex, binnedstats
+
+
+EDGES = {
+    'linear': np.linspace(0.0, 1.0, 11),
+    'log': np.logspace(10, 15, 21),
+    'irregular': np.array([0.0, 0.1, 0.15, 0.5, 0.9, 1.0]),
+}
+
+
+def _bruteindex(values, edges):
+    """Bin of each value with edges[i] < value <= edges[i + 1], or -1"""
+
+    idx = np.full(len(values), -1)
+
+    for i in range(len(edges) - 1):
+        idx[(values > edges[i]) & (values <= edges[i + 1])] = i
+
+    return idx
+
+
+def _values(edges, seed):
+    """Random values around the edges, including the edges themselves and
+    their neighbouring floats"""
+
+    rng = np.random.RandomState(seed)
+    low, high = edges[0], edges[-1]
+    values = np.concatenate((
+        low + (high - low) * (rng.random_sample(2000) * 1.2 - 0.1),
+        edges, np.nextafter(edges, np.inf), np.nextafter(edges, -np.inf),
+        [np.nan]))
+    rng.shuffle(values)
+
+    return values
+
+
+@pytest.mark.parametrize('spacing', sorted(EDGES))
+def test_binindex(spacing):
+    edges = EDGES[spacing]
+    values = _values(edges, 0)
+
+    np.testing.assert_array_equal(binindex(values, edges),
+                                  _bruteindex(values, edges))
+
+
+def test_halobins():
+    edges = [EDGES['log'], EDGES['irregular']]
+    values = [_values(edges[0], 1)[:2000], _values(edges[1], 2)[:2000]]
+
+    bins = HaloBins(values, edges)
+    first, second = [_bruteindex(v, e) for v, e in zip(values, edges)]
+
+    assert bins.shape == (20, 5)
+    for i in range(bins.shape[0]):
+        for j in range(bins.shape[1]):
+            expected = np.flatnonzero((first == i) & (second == j))
+            np.testing.assert_array_equal(bins.indices((i, j)), expected)
+            assert bins.counts[i, j] == len(expected)
+
+    inside = np.flatnonzero((first >= 0) & (second >= 0))
+    np.testing.assert_array_equal(np.sort(bins.inside()), inside)
+
+
+@pytest.mark.parametrize('spacing', sorted(EDGES))
+def test_binnedstats(spacing):
+    edges = EDGES[spacing]
+    x = _values(edges, 3)
+    y = np.random.RandomState(4).standard_normal(len(x))
+
+    # An empty bin
+    x[(x > edges[1]) & (x <= edges[2])] = edges[0]
+
+    stats = binnedstats(x, y, edges, percentiles=[15.9, 84.1])
+    idx = _bruteindex(x, edges)
+
+    for i in range(len(edges) - 1):
+        mine = y[idx == i]
+        assert stats['count'][i] == len(mine)
+
+        if len(mine) == 0:
+            assert np.isnan(stats['mean'][i]) and np.isnan(stats['std'][i])
+            assert np.all(np.isnan(stats['percentiles'][i]))
+            continue
+
+        np.testing.assert_allclose(stats['mean'][i], np.mean(mine))
+        np.testing.assert_allclose(stats['std'][i], np.std(mine),
+                                   atol=1e-12)
+        np.testing.assert_allclose(stats['median'][i], np.median(mine))
+        np.testing.assert_allclose(stats['percentiles'][i],
+                                   np.percentile(mine, [15.9, 84.1]))
+
+
+def test_binnedstats_empty():
+    stats = binnedstats(np.zeros(0), np.zeros(0), EDGES['linear'])
+
+    np.testing.assert_array_equal(stats['count'], np.zeros(10))
+    assert np.all(np.isnan(stats['median']))
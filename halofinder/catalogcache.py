@@ -0,0 +1,310 @@
+"""catalogcache.py
+Persistent binary cache of parsed halo catalogs. Each entry is a .npy file
+(or a columnar directory, see columnarcatalog.py) holding the halos next to a
+.json file holding the header, so later loads can memory-map the halos
+instead of re-parsing the ascii file.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from .columnarcatalog import ColumnarCatalog, writecolumnar
+
+
+CACHEDIR = os.environ.get(
+    'MYTOOLS_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'mytools', 'catalogs'))
+
+MAXSIZE = int(os.environ.get('MYTOOLS_CACHE_MAXSIZE', 50 * 1024**3)) # Bytes
+
+
+class CatalogCache(object):
+    """Size-bounded cache of parsed catalogs
+
+    Parameters
+    ----------
+    cachedir : str, optional
+        Directory of the cached files, default is CACHEDIR (which can be set
+        through the MYTOOLS_CACHE_DIR environment variable)
+    maxsize : int, optional
+        Maximum total size of the cache in bytes, default is MAXSIZE. Least
+        recently used entries are evicted to stay below it
+
+    Examples
+    --------
+    >>> from mytools.halofinder.catalogcache import CatalogCache
+    >>> cache = CatalogCache('/path/to/cache/dir', maxsize=10 * 1024**3)
+    >>> rockstar.load(only=['mvir', 'num_p'], cache=cache)
+    """
+
+    def __init__(self, cachedir=None, maxsize=None):
+        """Constructor for CatalogCache class"""
+
+        self.cachedir = CACHEDIR if cachedir is None else cachedir
+        self.maxsize = MAXSIZE if maxsize is None else maxsize
+
+    def key(self, path, selection):
+        """Generating the key of a cache entry
+
+        Parameters
+        ----------
+        path : str or list of str
+            Path to the source file(s)
+        selection : dict
+            Anything (json serializable, numpy scalars and arrays are
+            converted to lists and numbers) that changes the parsed array,
+            e.g. selected columns, their types and filters
+
+        Returns
+        -------
+        str
+        """
+
+        sources = []
+        for _path in _aslist(path):
+            stat = os.stat(_path)
+            sources.append([os.path.abspath(_path), stat.st_size,
+                            stat.st_mtime])
+
+        identity = json.dumps([sources, selection], sort_keys=True,
+                              default=_jsonable)
+
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Loading a cached catalog
+
+        Returns
+        -------
+        (numpy.memmap, dict) or (None, None)
+            Copy-on-write memory-mapped halos and their header, None if the
+            entry doesn't exist
+        """
+
+        datapath, metapath = self._paths(key)
+
+        if not (os.path.isfile(datapath) and os.path.isfile(metapath)):
+            return None, None
+
+        try:
+            with open(metapath) as _file:
+                meta = json.load(_file)
+            halos = np.load(datapath, mmap_mode='c')
+        except (IOError, OSError, ValueError):
+            self._remove(key)
+            return None, None
+
+        # Marking the entry as recently used
+        os.utime(metapath, None)
+
+        return halos, meta['header']
+
+    def getcolumnar(self, key, columns=None):
+        """Loading a cached columnar catalog
+
+        Parameters
+        ----------
+        key : str
+        columns : list of str, optional
+            Only expose these columns
+
+        Returns
+        -------
+        (ColumnarCatalog, dict) or (None, None)
+        """
+
+        colspath, metapath = self._colspath(key), self._paths(key)[1]
+
+        if not (os.path.isdir(colspath) and os.path.isfile(metapath)):
+            return None, None
+
+        try:
+            with open(metapath) as _file:
+                meta = json.load(_file)
+            halos = ColumnarCatalog(colspath, columns=columns)
+        except (IOError, OSError, ValueError):
+            self._remove(key)
+            return None, None
+
+        os.utime(metapath, None)
+
+        return halos, meta['header']
+
+    def put(self, key, path, halos, header):
+        """Saving a catalog into the cache
+
+        Parameters
+        ----------
+        key : str
+        path : str or list of str
+            Path to the source file(s)
+        halos : numpy.ndarray
+        header : dict
+        """
+
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+        datapath = self._paths(key)[0]
+
+        # Writing into temporary files first to never leave half written
+        # entries behind
+        with open(datapath + '.tmp', 'wb') as _file:
+            np.save(_file, halos)
+        os.rename(datapath + '.tmp', datapath)
+
+        self._putmeta(key, path, header)
+
+    def putcolumnar(self, key, path, halos, header, dtype=None):
+        """Saving a catalog into the cache with one file per column
+
+        Parameters
+        ----------
+        key : str
+        path : str or list of str
+            Path to the source file(s)
+        halos : numpy.ndarray or iterable of numpy.ndarray
+            Structured array of the halos, or its chunks written one at a
+            time (e.g. Rockstar.iterchunks())
+        header : dict
+        dtype : numpy.dtype, optional
+            Datatype of the chunks, only needed for chunks
+        """
+
+        colspath = self._colspath(key)
+
+        if isinstance(halos, np.ndarray):
+            halos, dtype = [halos], halos.dtype
+
+        if os.path.isdir(colspath + '.tmp'):
+            shutil.rmtree(colspath + '.tmp')
+        writecolumnar(colspath + '.tmp', halos, dtype)
+        shutil.rmtree(colspath, ignore_errors=True)
+        os.rename(colspath + '.tmp', colspath)
+
+        self._putmeta(key, path, header)
+
+    def _putmeta(self, key, path, header):
+        """Writing the metadata file of an entry, which makes it visible"""
+
+        metapath = self._paths(key)[1]
+
+        with open(metapath + '.tmp', 'w') as _file:
+            json.dump({'sources': [os.path.abspath(p) for p in _aslist(path)],
+                       'header': header}, _file, default=str)
+        os.rename(metapath + '.tmp', metapath)
+
+        # Even if it is larger than the cache, the new entry is kept
+        self.evict(keep=key)
+
+    def invalidate(self, path):
+        """Removing all cached entries made from a given source file"""
+
+        source = os.path.abspath(path)
+
+        for key, meta in self._entries():
+            if source in meta.get('sources', [meta.get('source')]):
+                self._remove(key)
+
+    def clear(self):
+        """Removing all cached entries"""
+
+        for key, _ in self._entries():
+            self._remove(key)
+
+    def evict(self, keep=None):
+        """Removing least recently used entries until the total size of the
+        cache drops below self.maxsize
+
+        Parameters
+        ----------
+        keep : str, optional
+            Key of an entry which is never removed, e.g. the one just written
+        """
+
+        entries = []
+        for key, _ in self._entries():
+            try:
+                entries.append((os.path.getmtime(self._paths(key)[1]),
+                                self._size(key), key))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, key in sorted(entries):
+            if total <= self.maxsize:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            total -= size
+
+    def _entries(self):
+        """Iterating over (key, metadata) of all entries"""
+
+        if not os.path.isdir(self.cachedir):
+            return
+
+        for name in os.listdir(self.cachedir):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.cachedir, name)) as _file:
+                    yield key, json.load(_file)
+            except (IOError, OSError, ValueError):
+                continue
+
+    def _paths(self, key):
+        """Paths of the data and metadata files of an entry"""
+
+        base = os.path.join(self.cachedir, key)
+        return base + '.npy', base + '.json'
+
+    def _colspath(self, key):
+        """Path of the columnar directory of an entry"""
+
+        return os.path.join(self.cachedir, key) + '.cols'
+
+    def _size(self, key):
+        """Total size of the files of an entry"""
+
+        paths = [path for path in self._paths(key) if os.path.isfile(path)]
+
+        colspath = self._colspath(key)
+        if os.path.isdir(colspath):
+            paths.extend(os.path.join(colspath, name)
+                         for name in os.listdir(colspath))
+
+        return sum(os.path.getsize(path) for path in paths)
+
+    def _remove(self, key):
+        """Removing an entry"""
+
+        # Removing the metadata first, so a partially removed entry is never
+        # picked up
+        for path in self._paths(key)[::-1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        shutil.rmtree(self._colspath(key), ignore_errors=True)
+
+
+def _aslist(path):
+    """Converting a path or a list of paths to a list"""
+
+    return [path] if isinstance(path, str) else list(path)
+
+
+def _jsonable(value):
+    """Python numbers and lists of numpy scalars and arrays, str of anything
+    else json can't serialize"""
+
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
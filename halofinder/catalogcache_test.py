@@ -0,0 +1,41 @@
+"""catalogcache_test.py
+Checking the keys and entries of CatalogCache
+"""
+
+import numpy as np
+
+from .catalogcache import CatalogCache
+
+
+def test_key_numpy(tmp_path):
+    path = tmp_path / 'halos.ascii'
+    path.write_text(u'0 1\n')
+    cache = CatalogCache(str(tmp_path / 'cache'))
+
+    numpy = cache.key(str(path), {'where': {
+        'mvir': (np.float32(1.5), None), 'PID': np.int64(-1),
+        'num_p': [np.int32(20), np.arange(2)[1]],
+        'bounds': np.array([0.5, 2.0])}})
+    python = cache.key(str(path), {'where': {
+        'mvir': (1.5, None), 'PID': -1, 'num_p': [20, 1],
+        'bounds': [0.5, 2.0]}})
+
+    assert numpy == python
+    assert cache.key(str(path), {'where': {'PID': np.int64(1)}}) != python
+
+
+def test_roundtrip(tmp_path):
+    path = tmp_path / 'halos.ascii'
+    path.write_text(u'0 1\n')
+    cache = CatalogCache(str(tmp_path / 'cache'))
+    halos = np.zeros(10, dtype=[('id', np.int64), ('mvir', np.float32)])
+    halos['id'] = np.arange(10)
+
+    key = cache.key(str(path), {'where': {'mvir': (np.float32(0), None)}})
+    assert cache.get(key) == (None, None)
+
+    cache.put(key, str(path), halos, {'a': ['1.0']})
+    cached, header = cache.get(key)
+
+    assert np.array_equal(cached, halos)
+    assert header == {'a': ['1.0']}
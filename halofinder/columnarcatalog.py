@@ -0,0 +1,186 @@
+"""columnarcatalog.py
+Column-oriented on-disk layout of halo catalogs. Each column is stored in its
+own raw (or .npy) file and memory-mapped only the first time it is accessed.
+"""
+
+import os
+import json
+
+import numpy as np
+
+
+MANIFEST = 'columns.json'
+
+
+class ColumnarCatalog(object):
+    """Lazy, per-column memory-mapped catalog
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory written by savecolumnar
+    columns : list of str, optional
+        Only expose these columns
+
+    Examples
+    --------
+    >>> from mytools.halofinder.columnarcatalog import ColumnarCatalog
+    >>> halos = ColumnarCatalog('/path/to/columnar/dir')
+    >>> halos['mvir'] # Only mvir is read from the disk
+    """
+
+    def __init__(self, path, columns=None):
+        """Constructor for ColumnarCatalog class"""
+
+        self.path = path
+        self._columns = {}
+
+        with open(os.path.join(path, MANIFEST)) as _file:
+            manifest = json.load(_file)
+
+        self.nhalos = manifest['nhalos']
+        self._files = dict((tag, name) for tag, _, name in manifest['columns'])
+
+        tags = [tag for tag, _, _ in manifest['columns']]
+        if columns is not None:
+            for tag in columns:
+                if tag not in self._files:
+                    raise KeyError(tag)
+            tags = [tag for tag in tags if tag in columns]
+
+        types = dict((tag, t) for tag, t, _ in manifest['columns'])
+        self.dtype = np.dtype([(tag, types[tag]) for tag in tags])
+
+    def __getitem__(self, key):
+        """Accessing a column (str), a structured copy of several columns
+        (list of str) or a structured copy of some rows of all the columns
+        (int, slice, boolean mask or array of rows), like the rows of a
+        structured array"""
+
+        if isinstance(key, list) and len(key) > 0 and \
+           all(isinstance(tag, str) for tag in key):
+            output = np.empty(self.nhalos,
+                              dtype=[(tag, self.dtype[tag]) for tag in key])
+            for tag in key:
+                output[tag] = self[tag]
+            return output
+
+        if not isinstance(key, str):
+            return self._rows(key)
+
+        if key not in self.dtype.names:
+            raise KeyError(key)
+
+        if key not in self._columns:
+            self._columns[key] = self._map(key)
+
+        return self._columns[key]
+
+    def __setitem__(self, key, value):
+        """Overwriting the values of a column in memory"""
+
+        self[key][...] = value
+
+    def __contains__(self, key):
+        return key in self.dtype.names
+
+    def __len__(self):
+        return self.nhalos
+
+    def _map(self, key):
+        """Memory-mapping a column, from a .npy file or a raw file of
+        self.nhalos values"""
+
+        path = os.path.join(self.path, self._files[key])
+
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='c')
+
+        if self.nhalos == 0:
+            return np.zeros(0, dtype=self.dtype[key])
+
+        return np.memmap(path, dtype=self.dtype[key], mode='c',
+                         shape=(self.nhalos,))
+
+    def _rows(self, key):
+        """Gathering rows of all the columns into a structured array"""
+
+        if isinstance(key, (int, np.integer)):
+            return self._rows(slice(key, key + 1 if key != -1 else None))[0]
+
+        if isinstance(key, list):
+            key = np.asarray(key)
+            if key.dtype != bool:
+                key = key.astype(np.intp)
+
+        columns = [self[tag][key] for tag in self.dtype.names]
+        output = np.empty(len(columns[0]) if columns else 0,
+                          dtype=self.dtype)
+        for tag, column in zip(self.dtype.names, columns):
+            output[tag] = column
+
+        return output
+
+    def loaded(self):
+        """Tags of the columns which have been accessed so far"""
+
+        return list(self._columns.keys())
+
+    @property
+    def nbytes(self):
+        """Size of the columns which have been accessed so far"""
+
+        return sum(column.nbytes for column in self._columns.values())
+
+
+def savecolumnar(path, halos):
+    """Saving a structured array into a columnar directory
+
+    Parameters
+    ----------
+    path : str
+        Path to the output directory
+    halos : numpy.ndarray
+        Structured array of halos
+    """
+
+    writecolumnar(path, [halos], halos.dtype)
+
+
+def writecolumnar(path, chunks, dtype):
+    """Writing chunks of halos into a columnar directory, one chunk at a
+    time
+
+    Parameters
+    ----------
+    path : str
+        Path to the output directory
+    chunks : iterable of numpy.ndarray
+        Structured arrays of consecutive halos, e.g. Rockstar.iterchunks()
+    dtype : numpy.dtype
+        Datatype of the chunks
+    """
+
+    dtype = np.dtype(dtype)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    # Tags like 'T/|U|' can't be used as file names
+    columns = [(tag, dtype[tag].str, 'column%03d.bin' % i)
+               for i, tag in enumerate(dtype.names)]
+    files = [open(os.path.join(path, name), 'wb') for _, _, name in columns]
+    nhalos = 0
+
+    try:
+        for chunk in chunks:
+            for (tag, _, _), _file in zip(columns, files):
+                np.ascontiguousarray(chunk[tag], dtype=dtype[tag]).tofile(
+                    _file)
+            nhalos += len(chunk)
+    finally:
+        for _file in files:
+            _file.close()
+
+    with open(os.path.join(path, MANIFEST), 'w') as _file:
+        json.dump({'nhalos': nhalos, 'columns': columns}, _file)
@@ -0,0 +1,35 @@
+"""columnarcatalog_test.py
+Checking that ColumnarCatalog rows match the rows of a structured array
+"""
+
+import numpy as np
+
+from .columnarcatalog import ColumnarCatalog, savecolumnar, writecolumnar
+
+
+def _halos(nhalos):
+    halos = np.zeros(nhalos, dtype=[('id', np.int64), ('mvir', np.float32)])
+    halos['id'] = np.arange(nhalos)
+    halos['mvir'] = np.arange(nhalos) * 0.5
+
+    return halos
+
+
+def test_rows(tmp_path):
+    halos = _halos(4)
+    savecolumnar(str(tmp_path), halos)
+    catalog = ColumnarCatalog(str(tmp_path))
+
+    for key in ([True, False, True, False], [1, 3], [],
+                np.array([False, True, True, False]), slice(1, None), -1):
+        assert np.array_equal(catalog[key], halos[key])
+
+
+def test_chunks(tmp_path):
+    halos = _halos(10)
+    writecolumnar(str(tmp_path), [halos[:3], halos[3:3], halos[3:]],
+                  halos.dtype)
+    catalog = ColumnarCatalog(str(tmp_path), columns=['mvir'])
+
+    assert len(catalog) == 10
+    assert np.array_equal(catalog['mvir'], halos['mvir'])
@@ -0,0 +1,187 @@
+"""hierarchy.py
+Host/subhalo hierarchy of a halo catalog, built from halo ids and parent ids
+(Rockstar PID), stored as compressed sparse rows of children
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix
+
+from .idindex import IdIndex, NOTAVLBL
+
+
+class HaloHierarchy(object):
+    """Host/subhalo hierarchy with per-host reductions
+
+    Parameters
+    ----------
+    ids : numpy.ndarray of int
+        Id of each halo
+    pids : numpy.ndarray of int
+        Id of the parent of each halo, negative for host halos. Parents
+        which are not in ids (e.g. filtered out) make their subhalos hosts
+    idindex : IdIndex, optional
+        An already built index of ids
+
+    Attributes
+    ----------
+    self.parent : numpy.ndarray of int
+        Row of the parent of each halo, NOTAVLBL for hosts
+    self.root : numpy.ndarray of int
+        Row of the top level host of each halo (itself for hosts)
+    self.offsets, self.children : numpy.ndarray of int
+        Direct subhalos of row i are self.children[offsets[i]:offsets[i+1]]
+    self.suboffsets, self.subhalos : numpy.ndarray of int
+        All (nested) subhalos of host i are
+        self.subhalos[suboffsets[i]:suboffsets[i+1]]
+
+    Examples
+    --------
+    >>> from mytools.halofinder.hierarchy import HaloHierarchy
+    >>> hierarchy = HaloHierarchy(halos['id'], halos['PID'])
+    >>> subs = halos[hierarchy.subhalosof(row)]
+    >>> submass = hierarchy.sum(halos['mvir'])
+    """
+
+    def __init__(self, ids, pids, idindex=None):
+        """Constructor for HaloHierarchy class"""
+
+        pids = np.asarray(pids).astype(np.int64)
+        self.nhalos = len(pids)
+
+        idindex = IdIndex(ids) if idindex is None else idindex
+
+        self.parent = np.full(self.nhalos, NOTAVLBL, dtype=np.int64)
+        issub = pids >= 0
+        self.parent[issub] = idindex.lookup(pids[issub])
+
+        self.root = _resolveroots(self.parent)
+
+        self.offsets, self.children = _csr(self.parent)
+
+        nested = np.where(self.root != np.arange(self.nhalos), self.root,
+                          NOTAVLBL)
+        self.suboffsets, self.subhalos = _csr(nested)
+
+    def ishost(self):
+        """Mask of the host (top level) halos"""
+
+        return self.parent == NOTAVLBL
+
+    def childrenof(self, row):
+        """Rows of the direct subhalos of a halo"""
+
+        return self.children[self.offsets[row]:self.offsets[row + 1]]
+
+    def subhalosof(self, row):
+        """Rows of all the (nested) subhalos of a host halo"""
+
+        return self.subhalos[self.suboffsets[row]:self.suboffsets[row + 1]]
+
+    def count(self, nested=True):
+        """Number of subhalos of each halo
+
+        Parameters
+        ----------
+        nested : bool, optional
+            Count all the subhalos of each host (zero for subhalos). If
+            False, count the direct subhalos of each halo
+        """
+
+        return np.diff(self._csr(nested)[0])
+
+    def sum(self, values, nested=True):
+        """Sum of a property of the subhalos of each halo (zero for halos
+        without subhalos)"""
+
+        return self.reduce(values, np.add, nested=nested, empty=0)
+
+    def max(self, values, nested=True):
+        """Maximum of a property of the subhalos of each halo (NaN for halos
+        without subhalos)"""
+
+        return self.reduce(values, np.maximum, nested=nested)
+
+    def reduce(self, values, ufunc, nested=True, empty=np.nan):
+        """Reducing a property of the subhalos of each halo
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            A property of all the halos, e.g. halos['mvir']
+        ufunc : numpy.ufunc
+            e.g. np.add, np.maximum, np.minimum
+        nested : bool, optional
+            Reduce all the subhalos of each host, or the direct subhalos of
+            each halo if False
+        empty : number, optional
+            Result of the halos without subhalos
+
+        Returns
+        -------
+        numpy.ndarray
+            One element per halo
+        """
+
+        offsets, members = self._csr(nested)
+        values = np.asarray(values)
+
+        result = np.full(self.nhalos, empty,
+                         dtype=np.result_type(values, empty))
+
+        nonempty = np.flatnonzero(offsets[1:] > offsets[:-1])
+        if len(nonempty) > 0:
+            result[nonempty] = ufunc.reduceat(values[members],
+                                              offsets[nonempty])
+
+        return result
+
+    def _csr(self, nested):
+        """Offsets and members of the nested or direct subhalos"""
+
+        if nested:
+            return self.suboffsets, self.subhalos
+
+        return self.offsets, self.children
+
+
+def _resolveroots(parent):
+    """Finding the top level host of each halo by pointer jumping
+
+    Each iteration doubles the resolved depth of the hierarchy, so the cost
+    is O(n log(depth)). Halos in a parent cycle become their own roots.
+    """
+
+    rows = np.arange(len(parent))
+    root = np.where(parent == NOTAVLBL, rows, parent)
+
+    for _ in range(64):
+        jumped = root[root]
+        if np.array_equal(jumped, root):
+            return root
+        root = jumped
+
+    # Malformed catalogs, parents pointing to each other
+    cyclic = root[root] != root
+    root[cyclic] = rows[cyclic]
+
+    return root
+
+
+def _csr(groups):
+    """Grouping rows by a group row, NOTAVLBL for ungrouped rows
+
+    A counting sort (scipy's COO to CSR conversion) in linear time, rows
+    of each group are sorted.
+
+    Returns
+    -------
+    offsets, members : numpy.ndarray of int
+    """
+
+    n = len(groups)
+    grouped = np.flatnonzero(groups != NOTAVLBL)
+
+    csr = coo_matrix((np.ones(len(grouped), dtype=np.int8),
+                      (groups[grouped], grouped)), shape=(n, n)).tocsr()
+
+    return csr.indptr.astype(np.int64), csr.indices.astype(np.int64)
@@ -0,0 +1,166 @@
+"""idindex.py
+Mapping halo (or particle) ids to their rows without copying any record
+"""
+
+import numpy as np
+
+
+NOTAVLBL = -1
+
+
+class IdIndex(object):
+    """Vectorised id to row lookup
+
+    A dense int32 row map is used when the ids are compact, and a sorted
+    copy of the ids (searched with np.searchsorted) otherwise.
+
+    Parameters
+    ----------
+    ids : numpy.ndarray of int
+        Id of each row
+    density : float, optional
+        Use the dense map if (max(id) - min(id) + 1) <= density * len(ids).
+        The default, 4, is where both maps take the same memory
+
+    Examples
+    --------
+    >>> from mytools.halofinder.idindex import IdIndex, NOTAVLBL
+    >>> index = IdIndex(rockstar.halos['id'])
+    >>> rows = index.lookup([12, 345, 6789])
+    >>> found = rows != NOTAVLBL
+    """
+
+    def __init__(self, ids, density=4):
+        """Constructor for IdIndex class"""
+
+        ids = np.asarray(ids)
+        self.nids = len(ids)
+        self.dtype = ids.dtype
+        self.rowmap, self.sortedids, self.order = None, None, None
+        self.minid = int(np.min(ids)) if self.nids > 0 else 0
+
+        span = int(np.max(ids)) - self.minid + 1 if self.nids > 0 else 0
+
+        if 0 < span <= density * self.nids and self.nids < 2**31:
+            self.rowmap = np.full(span, NOTAVLBL, dtype=np.int32)
+            self.rowmap[ids - self.minid] = np.arange(self.nids,
+                                                      dtype=np.int32)
+        else:
+            self.order = np.argsort(ids, kind='mergesort')
+            self.sortedids = ids[self.order]
+
+    @classmethod
+    def fromarray(cls, array, meta):
+        """Rebuilding an index saved with IdIndex.toarray, e.g. from a
+        memory-mapped cache entry
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+        meta : dict
+        """
+
+        index = cls.__new__(cls)
+        index.nids, index.minid = meta['nids'], meta['minid']
+        index.rowmap, index.sortedids, index.order = None, None, None
+
+        if meta['dense']:
+            index.dtype = np.dtype(meta.get('dtype', np.int64))
+            index.rowmap = array
+        else:
+            # The rows are stored in the dtype of the ids, see toarray
+            index.dtype = array.dtype
+            index.sortedids = array[0]
+            index.order = array[1].view(np.int64)
+
+        return index
+
+    def toarray(self):
+        """The index as one array (the dense map, or the sorted ids on top of
+        their rows) and a json serializable dict, see IdIndex.fromarray
+
+        The sorted ids keep their values: they are stored as uint64 if they
+        are unsigned 64 bits integers, as int64 otherwise, and the rows are
+        stored in the same dtype.
+        """
+
+        meta = {'nids': self.nids, 'minid': self.minid,
+                'dense': self.isdense(), 'dtype': self.dtype.str}
+
+        if self.isdense():
+            return self.rowmap, meta
+
+        dtype = np.uint64 if self.dtype == np.uint64 else np.int64
+
+        return np.vstack((self.sortedids.astype(dtype),
+                          self.order.astype(dtype))), meta
+
+    def isdense(self):
+        """Whether the dense row map is used"""
+
+        return self.rowmap is not None
+
+    def sortedrows(self):
+        """Rows of the halos (or particles) sorted by id"""
+
+        if self.rowmap is not None:
+            return self.rowmap[self.rowmap != NOTAVLBL].astype(np.int64)
+
+        return self.order
+
+    def lookup(self, ids):
+        """Finding the rows of the given ids
+
+        Parameters
+        ----------
+        ids : int or array of int
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Rows of the ids, NOTAVLBL for unavailable ids
+        """
+
+        shape = np.shape(ids)
+        ids = np.asarray(ids).ravel()
+        rows = np.full(ids.shape, NOTAVLBL, dtype=np.int64)
+
+        if self.nids == 0:
+            return rows.reshape(shape)
+
+        if self.rowmap is not None:
+            dtype = np.uint64 if self.dtype == np.uint64 else np.int64
+            valid, ids = _castids(ids, dtype)
+            pos = ids - dtype(self.minid)
+            valid &= (pos >= 0) & (pos < len(self.rowmap))
+            rows[valid] = self.rowmap[pos[valid]]
+        else:
+            valid, ids = _castids(ids, self.sortedids.dtype)
+            pos = np.searchsorted(self.sortedids, ids)
+            pos[pos == self.nids] = self.nids - 1
+            found = valid & (self.sortedids[pos] == ids)
+            rows[found] = self.order[pos[found]]
+
+        return rows.reshape(shape)
+
+
+def _castids(ids, dtype):
+    """Casting ids to the integer dtype of the index, ids out of the range
+    of dtype (e.g. negative ids of an unsigned index) are not valid
+
+    Returns
+    -------
+    valid : numpy.ndarray of bool
+    ids : numpy.ndarray of dtype
+        Zero where not valid
+    """
+
+    if ids.dtype.kind not in 'iu':
+        ids = ids.astype(np.int64)
+
+    info, own = np.iinfo(dtype), np.iinfo(ids.dtype)
+    low, high = max(info.min, own.min), min(info.max, own.max)
+
+    valid = (ids >= ids.dtype.type(low)) & (ids <= ids.dtype.type(high))
+
+    return valid, np.where(valid, ids, 0).astype(dtype, copy=False)
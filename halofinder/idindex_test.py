@@ -0,0 +1,67 @@
+"""idindex_test.py
+Checking the id to row lookups of IdIndex
+"""
+
+import numpy as np
+import pytest
+
+from .idindex import IdIndex, NOTAVLBL
+
+
+def _ids(dtype, dense, seed):
+    """Shuffled unique ids, compact (dense) or spread over the range of
+    dtype"""
+
+    rng = np.random.RandomState(seed)
+
+    if dense:
+        ids = np.arange(5, 1005)
+    else:
+        ids = np.unique(rng.randint(0, 2**31 - 1, 2000))[:1000]
+        ids *= 2
+
+    ids = ids.astype(dtype)
+    if dtype == np.uint64 and not dense:
+        # Beyond the range of int64
+        ids += np.uint64(2**63)
+
+    rng.shuffle(ids)
+
+    return ids
+
+
+@pytest.mark.parametrize('dense', [True, False])
+@pytest.mark.parametrize('dtype', [np.int32, np.uint32, np.int64,
+                                   np.uint64])
+def test_lookup(dtype, dense):
+    ids = _ids(dtype, dense, 0)
+    index = IdIndex(ids)
+    rebuilt = IdIndex.fromarray(*index.toarray())
+
+    assert index.isdense() == dense
+
+    missing = (ids[:10] + dtype(1)) if not dense else \
+              np.array([0, 4, 1005], dtype=dtype)
+
+    for idx in (index, rebuilt):
+        np.testing.assert_array_equal(idx.lookup(ids), np.arange(len(ids)))
+        assert np.all(idx.lookup(missing) == NOTAVLBL)
+        assert np.all(idx.lookup(np.array([-1, -2**40])) == NOTAVLBL)
+        assert idx.lookup(ids[3]) == 3
+
+        np.testing.assert_array_equal(ids[idx.sortedrows()], np.sort(ids))
+
+
+def test_lookup_other_dtype():
+    ids = _ids(np.uint32, False, 1)
+    index = IdIndex(ids)
+
+    np.testing.assert_array_equal(index.lookup(ids.astype(np.int64)),
+                                  np.arange(len(ids)))
+    assert index.lookup(np.int64(2**32 + int(ids[0]))) == NOTAVLBL
+
+
+def test_empty():
+    index = IdIndex(np.zeros(0, dtype=np.int64))
+
+    assert np.all(index.lookup([1, 2]) == NOTAVLBL)
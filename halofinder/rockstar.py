@@ -1,14 +1,29 @@
 """rockstar.py
-The aim of this module is to load a rockstar ascii file into an rockstar
-object variable.
+The aim of this module is to load a rockstar ascii (or binary) file into an
+rockstar object variable.
 """
 
 from __future__ import print_function
 
+import glob
+import os
+import re
+
 import numpy as np
 
+from .asciiparser import fieldnames, parseascii, iterascii, rowbytes
+from .binning import HaloBins, binnedstats
+from .catalogcache import CatalogCache
+from .columnarcatalog import ColumnarCatalog
+from .hierarchy import HaloHierarchy
+from .idindex import IdIndex, NOTAVLBL
+from .rockstarbin import isrockstarbin, loadheader, loadhalos, iterhalos, \
+                         HALODTYPE
+from .spatialindex import SpatialIndex
+from .streaming import StreamingBinnedStats, StreamingMinMax
+
 
-NOTAVLBL = -1
+CHUNKHALOS = 1024**2 # Halos per chunk of Rockstar.iterchunks
 
 
 class Rockstar(object):
@@ -16,8 +31,13 @@ class Rockstar(object):
 
     Parameters
     ----------
-    path : str
-        Path to the rockstar ascii file
+    path : str or list of str
+        Path to the rockstar ascii file, or to a binary (halos_*.bin) file.
+        A glob pattern or a list of paths loads the blocks of a catalog
+        (e.g. halos_0.*.ascii) as a single catalog
+    schema : RockstarSchema, optional
+        Column tags and types of the file, sniffed from its head (or taken
+        from the schema cache) by default
 
     Methods
     -------
@@ -32,81 +52,354 @@ class Rockstar(object):
     --------
     >>> from mytools.halofinders.rockstar import Rockstar
     >>> rockstar = Rockstar('/path/to/rockstar/ascii/file')
+    >>> rockstar = Rockstar('/path/to/rockstar/halos_0.*.ascii')
     """
 
-    def __init__(self, path):
+    def __init__(self, path, schema=None):
         """Constructor for Rockstar class"""
 
-        self.path = path
-        self.dtype, self.halos, self.halossortedbyid = [], [], []
+        self.paths = _blockpaths(path)
+        self.path = self.paths[0]
+        self.dtype, self.halos = [], []
+        self.idindex = None
+        self._inidorder = (None, None)
+        self.spatialindex = None
+        self.hierarchy = None
         self.binnedhalos = {}
+        self.halobins = None
         self.usecols = []
+        self.schema = schema
 
+        self.format = 'binary' if isrockstarbin(self.path) else 'ascii'
         self.header = self._loadheader()
 
-    def load(self, only=None, exclude=None, onlyhosts=False):
+        if len(self.paths) > 1:
+            self._checkblocks()
+
+    def load(self, only=None, exclude=None, onlyhosts=False, where=None,
+             nprocs=None, cache=False, lazy=False, block=False,
+             compact=False):
         """Loading Rockstar ascii file to Rockstar.data
 
         Parameters
         ----------
         only : list of str, optional
-            A list of column tags to load
+            A list of column tags to load. Fields of Rockstar.halos are
+            named after the tags the way numpy.genfromtxt names them (see
+            asciiparser.fieldnames, e.g. 'A[x]' is 'Ax'), and columns can
+            be given by their tags or their field names
         exclude : list of str, optional
             A list of column tags to exclude them from loading
         onlyhosts : bool, optional
-            Keep only host halos
+            Keep only host halos, same as where={'PID': -1}
+        where : dict, optional
+            Filters applied while parsing, mapping a column tag to either a
+            value or a (min, max) tuple (both inclusive, None for an open
+            end). Rejected halos never reach Rockstar.halos
+        nprocs : int, optional
+            Number of processes used for parsing, default is the number of
+            cpus
+        cache : bool or CatalogCache, optional
+            Memory-map the parsed halos from a binary cache (a CatalogCache
+            with default settings if True), parsing and caching them on a
+            miss
+        lazy : bool, optional
+            Store the halos in the cache with one file per column and only
+            read a column the first time it is accessed (Rockstar.halos will
+            be a ColumnarCatalog)
+        block : bool, optional
+            Add a 'block' column with the index (in Rockstar.paths) of the
+            file each halo comes from
+        compact : bool or dict, optional
+            Store halos with 32 bits types, except ids and masses (see
+            compacttype). A dict maps column tags to the types overriding
+            this policy. Values which overflow or lose precision (see
+            asciiparser.castcolumn) raise a ValueError
 
         Examples
         --------
         >>> rockstar.load(only=['id', 'PID'], onlyhosts=True)
+        >>> rockstar.load(only=['mvir'], where={'mvir': (1e11, None)})
+        >>> rockstar.load(lazy=True)
+        >>> rockstar.load(compact={'mvir': np.float32})
         """
 
-        self._loaddtype(only, exclude)
+        where = dict(where) if where else {}
+        if onlyhosts:
+            where['PID'] = -1
+
+        if lazy:
+            cache = CatalogCache() if cache in (False, True) else cache
+            self._loadlazy(only, exclude, where, nprocs, cache, block,
+                           compact)
+            return
+
+        self._loaddtype(only, exclude, block, compact)
+        blocktag = 'block' if block else None
+        source = self.paths if len(self.paths) > 1 else self.path
+
+        if cache:
+            cache = CatalogCache() if cache is True else cache
+            key = cache.key(source, {
+                'usecols': self.usecols,
+                'dtype': [(tag, np.dtype(t).str) for tag, t in self.dtype],
+                'where': where})
+
+            halos, header = cache.get(key)
+            if halos is not None:
+                self.halos = halos
+                self.header.update(header)
+                return
+
+        if self.format == 'binary':
+            self.halos = loadhalos(source, self.dtype,
+                                   where=self._wherenames(where),
+                                   blocktag=blocktag)
+        else:
+            self.halos = parseascii(source,
+                                    self.dtype,
+                                    self.usecols,
+                                    len(self.header['column_tags']),
+                                    skip_header=19,
+                                    where=self._wherecols(where),
+                                    nprocs=nprocs,
+                                    blocktag=blocktag)
+
+        if cache:
+            cache.put(key, source, self.halos, self.header)
 
-        self.halos = np.genfromtxt(self.path,
-                                   skip_header=19,
-                                   usecols=self.usecols,
-                                   dtype=self.dtype)
 
-        if onlyhosts:
-            if 'PID' not in self.header['included_columns']:
-                raise KeyError("Can't find PID")
+    def iterchunks(self, columns=None, chunksize=CHUNKHALOS, where=None,
+                   nprocs=None, block=False, compact=False):
+        """Reading halos from the file(s) chunk by chunk, for catalogs
+        larger than the memory. Rockstar.halos is not modified
+
+        Parameters
+        ----------
+        columns : list of str, optional
+            Column tags to read, all columns by default
+        chunksize : int, optional
+            Approximate number of halos per chunk
+        where, nprocs, block, compact : optional
+            See Rockstar.load
+
+        Yields
+        ------
+        numpy.ndarray
+            Structured array of the halos of each chunk
+
+        Examples
+        --------
+        >>> from mytools.halofinder.streaming import StreamingTopK
+        >>> top = StreamingTopK(100, 'mvir')
+        >>> for chunk in rockstar.iterchunks(['id', 'mvir'],
+        ...                                  where={'PID': -1}):
+        ...     top.update(chunk)
+        """
+
+        dtype, usecols, _ = self._selectdtype(columns, None, block, compact)
+        blocktag = 'block' if block else None
+        where = dict(where) if where else {}
+        source = self.paths if len(self.paths) > 1 else self.path
+
+        if self.format == 'binary':
+            return iterhalos(source, dtype, where=self._wherenames(where),
+                             chunksize=chunksize, blocktag=blocktag)
+
+        return iterascii(source, dtype, usecols,
+                         len(self.header['column_tags']),
+                         skip_header=19,
+                         where=self._wherecols(where),
+                         nprocs=nprocs,
+                         chunksize=chunksize * rowbytes(self.path, 19),
+                         blocktag=blocktag)
+
+    def _loadlazy(self, only, exclude, where, nprocs, cache, block,
+                  compact):
+        """Loading halos as a ColumnarCatalog, parsing all the columns chunk
+        by chunk into the cache on a miss"""
+
+        self._loaddtype(block=block, compact=compact)
+        source = self.paths if len(self.paths) > 1 else self.path
+
+        key = cache.key(source, {
+            'layout': 'columnar',
+            'dtype': [(tag, np.dtype(t).str) for tag, t in self.dtype],
+            'where': where})
+
+        if cache.getcolumnar(key)[0] is None:
+            chunks = self.iterchunks(where=where, nprocs=nprocs, block=block,
+                                     compact=compact)
+            cache.putcolumnar(key, source, chunks, self.header, self.dtype)
+
+        halos, header = cache.getcolumnar(key)
+        if halos is None:
+            raise IOError('Can not read the columnar cache entry of %s'
+                          % self.path)
+
+        self.header.update(header)
+        self._loaddtype(only, exclude, block, compact)
+        self.halos = ColumnarCatalog(halos.path,
+                                     columns=[name for name, _ in self.dtype])
+
+    def _checkblocks(self):
+        """Checking that the headers of all blocks describe the same
+        catalog"""
+
+        for path in self.paths[1:]:
+            if self.format == 'binary':
+                header = loadheader(path)
+            else:
+                header = sniff(path)[0]
+
+            for key in _BLOCKKEYS:
+                if header.get(key) != self.header.get(key):
+                    raise ValueError('%s of %s does not match %s'
+                                     % (key, path, self.path))
+
+        self.header['Blocks'] = list(self.paths)
 
-            self.halos = np.array(
-                [d for d in self.halos if d['PID'] == -1],
-                dtype=self.dtype)
+    def _wherecols(self, where):
+        """Converting the column tags (or field names) of filters to column
+        indices"""
 
+        tags = self.header['column_tags']
+        names = fieldnames(tags)
+        wherecols = {}
+
+        for tag, cond in where.items():
+            if tag in tags:
+                wherecols[tags.index(tag)] = cond
+            elif tag in names:
+                wherecols[names.index(tag)] = cond
+            else:
+                raise KeyError("Can't find " + tag)
+
+        return wherecols
+
+    def _wherenames(self, where):
+        """Converting the column tags of filters to field names"""
+
+        names = fieldnames(self.header['column_tags'])
+
+        return dict((names[col], cond)
+                    for col, cond in self._wherecols(where).items())
 
     def sortbyid(self):
-        """Sorted halos by id, left unavailable halos zeros"""
+        """Indexing halos by id (Rockstar.idindex), without copying them
+
+        Examples
+        --------
+        >>> rockstar.sortbyid()
+        >>> rows = rockstar.idindex.lookup(ids)
+        >>> mvir = rockstar.halos['mvir'][rows[rows != NOTAVLBL]]
+        """
+
+        self.idindex = IdIndex(self.halos['id'])
+
+    @property
+    def halosinidorder(self):
+        """Halos sorted by id, a copy gathered on the first access after
+        Rockstar.sortbyid (which is called if needed)"""
+
+        if self.idindex is None:
+            self.sortbyid()
+
+        if self._inidorder[0] is not self.idindex:
+            self._inidorder = (self.idindex,
+                                self.halos[self.idindex.sortedrows()])
+
+        return self._inidorder[1]
+
+    @property
+    def halossortedbyid(self):
+        """Removed, it was indexed by id (halossortedbyid[id] was the halo
+        of that id)"""
+
+        raise AttributeError(
+            'Rockstar.halossortedbyid was removed, use '
+            'rockstar.halos[rockstar.idindex.lookup(ids)] for the halos of '
+            'given ids or Rockstar.halosinidorder for the halos sorted by id')
+
+    def buildhierarchy(self):
+        """Building the host/subhalo hierarchy of halos from their id and
+        PID columns (Rockstar.hierarchy)
+
+        Examples
+        --------
+        >>> rockstar.buildhierarchy()
+        >>> nsubs = rockstar.hierarchy.count()
+        >>> submass = rockstar.hierarchy.sum(rockstar.halos['mvir'])
+        """
+
+        if self.idindex is None:
+            self.sortbyid()
+
+        self.hierarchy = HaloHierarchy(self.halos['id'], self.halos['PID'],
+                                       idindex=self.idindex)
 
-        highestid = np.max(self.halos['id']) + 1
+    def indexpositions(self, periodic=True, leafsize=16):
+        """Building a spatial index of halo positions
+        (Rockstar.spatialindex)
 
-        self.halossortedbyid = np.zeros(highestid, dtype=self.dtype)
-        self.halossortedbyid['id'] = [NOTAVLBL] * highestid
+        Parameters
+        ----------
+        periodic : bool, optional
+            Use the periodic box size of the header
+        leafsize : int, optional
 
-        for halo in self.halos:
-            self.halossortedbyid[halo['id']] = halo
+        Examples
+        --------
+        >>> rockstar.indexpositions()
+        >>> offsets, rows = rockstar.spatialindex.within([[50, 50, 50]], 2.0)
+        >>> massive = rockstar.spatialindex.mostmassive(
+        ...     rockstar.halos['mvir'], 1.0)
+        """
+
+        positions = np.column_stack([self.halos[tag] for tag in 'xyz'])
+        boxsize = float(self.header['Box_size'][0]) if periodic else None
+
+        self.spatialindex = SpatialIndex(positions, boxsize=boxsize,
+                                         leafsize=leafsize)
 
     def binning(self, mbins, prop='mbound_vir'):
         """Binning halos based on a given mass bins
 
+        The halos inside the bins are gathered into one copy, sorted by bin,
+        and each Rockstar.binnedhalos[idx] is a view of that copy (not of
+        Rockstar.halos). To select rows of Rockstar.halos without copying,
+        use Rockstar.halobins.indices(idx), or halobins.perm and
+        halobins.offsets.
+
         Parameters
         ----------
-        mbins : array of float
-            Mass bins edges
+        mbins : array of float or list of array of float
+            Mass bins edges, or one array of edges per property
+        prop : str or list of str, optional
+            Property (or properties) to bin on. For several properties
+            Rockstar.binnedhalos is indexed by tuples of bin indices
 
         Examples
         --------
         >>> import numpy as np
         >>> mbins = np.logspace(10, 15, num=21, base=10)
         >>> rockstar.binning(mbins)
+        >>> rockstar.binning([mbins, np.linspace(0, 0.2, num=5)],
+        ...                  prop=['mvir', 'Spin'])
         """
 
-        for idx, (minm, maxm) in enumerate(zip(mbins[:-1], mbins[1:])):
-            self.binnedhalos[idx] = np.array(
-                [h for h in self.halos if minm < h[prop] <= maxm],
-                dtype=self.dtype)
+        props = [prop] if isinstance(prop, str) else list(prop)
+        edges = [mbins] if isinstance(prop, str) else list(mbins)
+
+        self.halobins = HaloBins([self.halos[p] for p in props], edges)
+
+        binned = self.halos[self.halobins.inside()]
+        offsets = self.halobins.offsets
+
+        self.binnedhalos = {}
+        for i, idx in enumerate(np.ndindex(*self.halobins.shape)):
+            key = idx[0] if len(idx) == 1 else idx
+            self.binnedhalos[key] = binned[offsets[i]:offsets[i + 1]]
 
     def vs(self, prop1, prop2, nbins=21, **kwargs):
         """Plotting the relations between Rockstar output properties
@@ -119,40 +412,98 @@ class Rockstar(object):
             Number of bins
         xscale, yscale : string, optional
         xmin, xmax, ymin, ymax : numbers, optional
+        chunksize : int, optional
+            Stream the halos from the file(s), see Rockstar.binnedstats
+
+        Returns
+        -------
+        xs, ys : list of float
+            Bin centers and the mean of prop2 in each non-empty bin
         """
 
-        sortedhalos = np.sort(self.halos, order=prop1)
+        stats = self.binnedstats(prop1, prop2, nbins=nbins,
+                                 xscale=kwargs.get('xscale'),
+                                 chunksize=kwargs.get('chunksize'))
 
-        if 'xscale' in kwargs:
-            xscale = kwargs.get('xscale')
-        else:
-            x99 = np.percentile(sortedhalos[prop1], 99)
-            x50 = np.percentile(sortedhalos[prop1], 50)
-            xscale = 'log' if x50 == 0 or x99/x50 >= 10 else 'linear'
-
-        if xscale == 'log':
-            bins = np.logspace(np.log10(sortedhalos[prop1][0]),
-                               np.log10(sortedhalos[prop1][-1]),
-                               num=nbins, base=10)
-        else:
-            bins = np.linspace(sortedhalos[prop1][0], sortedhalos[prop1][-1],
-                               num=nbins)
-
-        xs, ys = [], []
-        for bmin, bmax in zip(bins[:-1], bins[1:]):
-            values = [sortedhalos[prop2][i]
-                     for i in range(len(sortedhalos[prop1]))
-                     if bmin < sortedhalos[prop1][i] <= bmax]
-            if len(values) == 0:
-                continue
-            else:
-                ys.append(sum(values) / len(values))
-                if xscale == 'log':
-                    xs.append(10**(np.log10(bmin * bmax) / 2))
-                else:
-                    xs.append((bmin + bmax) / 2)
+        nonempty = stats['count'] > 0
+
+        return list(stats['x'][nonempty]), list(stats['mean'][nonempty])
+
+    def binnedstats(self, prop1, prop2, nbins=21, xscale=None,
+                    percentiles=(), chunksize=None):
+        """Statistics of a halo property in bins of another one
+
+        Parameters
+        ----------
+        prop1, prop2 : string
+            Halos properties, prop2 is binned based on prop1
+        nbins : integer, optional
+            Number of bin edges, spanning the range of prop1
+        xscale : string, optional
+            'log' or 'linear' bins, guessed from prop1 by default
+        percentiles : list of float, optional
+            Percentiles (between 0 and 100) of prop2 to compute in each bin
+        chunksize : int, optional
+            Instead of Rockstar.halos, read the two columns from the file(s)
+            in chunks of this many halos (see Rockstar.iterchunks), with two
+            passes over the file(s). Medians and percentiles are not
+            available in this mode and xscale is guessed from the first
+            chunk
+
+        Returns
+        -------
+        dict
+            'x' (bin centers), 'edges', 'count', 'mean', 'std', 'median' and
+            'percentiles', see binning.binnedstats
+
+        Examples
+        --------
+        >>> stats = rockstar.binnedstats('mvir', 'num_p', nbins=201,
+        ...                              percentiles=[15.9, 84.1])
+        >>> stats = rockstar.binnedstats('mvir', 'num_p', chunksize=10**6)
+        """
+
+        if chunksize is not None:
+            return self._streamedstats(prop1, prop2, nbins, xscale,
+                                       chunksize)
+
+        xvalues = self.halos[prop1]
+        xmin, xmax = np.min(xvalues), np.max(xvalues)
+
+        if xscale is None:
+            xscale = _guessscale(xvalues)
+
+        edges, centers = _edges(xmin, xmax, nbins, xscale)
+
+        stats = binnedstats(xvalues, self.halos[prop2], edges,
+                            percentiles=percentiles)
+        stats['x'] = centers
+        stats['edges'] = edges
+
+        return stats
 
-        return xs, ys
+    def _streamedstats(self, prop1, prop2, nbins, xscale, chunksize):
+        """Rockstar.binnedstats over chunks of the file(s)"""
+
+        minmax = StreamingMinMax()
+        for chunk in self.iterchunks([prop1], chunksize=chunksize):
+            if xscale is None and len(chunk) > 0:
+                xscale = _guessscale(chunk[prop1])
+            minmax.update(chunk[prop1])
+
+        edges, centers = _edges(minmax.min, minmax.max, nbins, xscale)
+
+        stats = StreamingBinnedStats(edges)
+        for chunk in self.iterchunks([prop1, prop2], chunksize=chunksize):
+            stats.update(chunk[prop1], chunk[prop2])
+
+        stats = stats.result()
+        stats['median'] = np.full(nbins - 1, np.nan)
+        stats['percentiles'] = np.full((nbins - 1, 0), np.nan)
+        stats['x'] = centers
+        stats['edges'] = edges
+
+        return stats
 
 
     def setheader(self, key, value):
@@ -167,79 +518,267 @@ class Rockstar(object):
         self.header[key] = value
 
     def _loadheader(self):
-        """Loading the header of the rockstar ascii halo file"""
-
-        header = {'units': {}}
-
-        with open(self.path) as _file:
-            for i, line in enumerate(_file):
-                line = line.strip('#').strip('\n')
-                if i == 0: # First line: column names
-                    header['column_tags'] = line.split(' ')
-                elif 0 < i <= 2:
-                    statements = line.split(';')
-                    for statement in statements:
-                        _extractkeyvalue(statement, '=', header)
-                elif 2 < i <= 8:
-                    statements = line.split(';')
-                    for statement in statements:
-                        _extractkeyvalue(statement, ':', header)
-                elif 8 < i <= 15: # Units
-                    if ' in ' in line:
-                        delim = ' in '
-                    elif ' is ' in line:
-                        delim = ' is '
-                    elif ' are ' in line:
-                        delim = ' are '
-                    else:
-                        continue
-                    parts = line.partition(':')[2].strip().partition(delim)
-                    key = parts[0].strip().replace(' ', '_')
-                    val = parts[2].strip()
-                    header['units'][key] = val
-                elif i > 15:
-                    break
+        """Loading the header and the schema of the rockstar halo file"""
+
+        if self.format == 'binary':
+            header = loadheader(self.path)
+            self.schema = RockstarSchema(
+                header['column_tags'],
+                [HALODTYPE[name] for name in HALODTYPE.names])
+            return header
+
+        header, self.schema = sniff(self.path, schema=self.schema)
 
         return header
 
-    def _loaddtype(self, only=None, exclude=None):
-        """Loading the datatypes of the rockstar ascii halo file"""
+    def _loaddtype(self, only=None, exclude=None, block=False,
+                   compact=False):
+        """Loading the datatypes of the rockstar halo file"""
 
-        with open(self.path) as _file:
-            for i, line in enumerate(_file):
-                if i == 20:
-                    inputs = line.strip('#').strip('\n').split(' ')
-                elif i > 20:
-                    break
+        self.dtype, self.usecols, tags = self._selectdtype(only, exclude,
+                                                           block, compact)
+        self.header['included_columns'] = tags
 
-        # Due to a reported bug in Rockstar, after generating parents of halos,
-        # the header won't be updated properly. Following we try to solve this
-        # problem.
-        # NOTE: it's not the best way to handle this bug!
-        if len(inputs) != len(self.header['column_tags']):
-            tmp_headers = self.header['column_tags'][:len(inputs) - 1]
-            tmp_headers.append('PID')
-            self.header['column_tags'] = tmp_headers
+    def _selectdtype(self, only=None, exclude=None, block=False,
+                     compact=False):
+        """Datatype, column indices and tags of the selected columns"""
+
+        types = self.schema.types
 
-        self.dtype, self.usecols, tags = [], [], []
-        zip_tag_elem = zip(self.header['column_tags'], inputs)
+        # Fields are named as numpy.genfromtxt would, columns can be
+        # selected by their tags or their field names
+        names = fieldnames(self.header['column_tags'])
 
-        for i, (tag, elem) in enumerate(zip_tag_elem):
-            if only is not None and len(only) > 0 and tag not in only:
+        if compact:
+            policy = compact if isinstance(compact, dict) else {}
+            types = [np.dtype(policy[tag]) if tag in policy
+                     else np.dtype(policy[name]) if name in policy
+                     else compacttype(tag, _type)
+                     for tag, name, _type in
+                     zip(self.header['column_tags'], names, types)]
+
+        dtype, usecols, tags = [], [], []
+        zip_tag_type = zip(self.header['column_tags'], names, types)
+
+        for i, (tag, name, _type) in enumerate(zip_tag_type):
+            if only is not None and len(only) > 0 and tag not in only \
+                    and name not in only:
                 continue
-            if exclude is not None and len(exclude) > 0 and tag in exclude:
+            if exclude is not None and len(exclude) > 0 and \
+                    (tag in exclude or name in exclude):
                 continue
 
-            self.dtype.append((tag, np.dtype(type(_2number(elem)).__name__)))
+            dtype.append((name, _type))
 
             tags.append(tag)
-            self.usecols.append(i)
+            usecols.append(i)
 
-        self.header['included_columns'] = tags
-
-        if len(self.dtype) < 1:
+        if len(dtype) < 1:
             raise LookupError('datatype array is empty')
 
+        if block:
+            dtype.append(('block', np.int32))
+            tags.append('block')
+
+        return dtype, usecols, tags
+
+def _guessscale(values):
+    """Guessing whether values should be binned logarithmically"""
+
+    x99, x50 = np.percentile(values, [99, 50])
+
+    return 'log' if x50 == 0 or x99/x50 >= 10 else 'linear'
+
+
+def _edges(xmin, xmax, nbins, xscale):
+    """Bin edges and centers spanning [xmin, xmax]"""
+
+    if xscale == 'log':
+        edges = np.logspace(np.log10(xmin), np.log10(xmax),
+                            num=nbins, base=10)
+        centers = np.sqrt(edges[:-1] * edges[1:])
+    else:
+        edges = np.linspace(xmin, xmax, num=nbins)
+        centers = (edges[:-1] + edges[1:]) / 2
+
+    return edges, centers
+
+
+class RockstarSchema(object):
+    """Column tags and types of a Rockstar halo file
+
+    Parameters
+    ----------
+    column_tags : list of str
+    types : list of numpy.dtype
+        Type of each column
+    """
+
+    def __init__(self, column_tags, types):
+        """Constructor for RockstarSchema class"""
+
+        self.column_tags = list(column_tags)
+        self.types = list(types)
+
+    @classmethod
+    def fromlines(cls, tagsline, dataline):
+        """Inferring the schema from the column names line and a data line
+        of an ascii file"""
+
+        inputs = dataline.strip('#').strip('\n').split(' ')
+        column_tags = tagsline.strip('#').strip('\n').split(' ')
+
+        # Due to a reported bug in Rockstar, after generating parents of
+        # halos, the header won't be updated properly. Following we try
+        # to solve this problem.
+        # NOTE: it's not the best way to handle this bug!
+        if len(inputs) != len(column_tags):
+            column_tags = column_tags[:len(inputs) - 1]
+            column_tags.append('PID')
+
+        types = [np.dtype(type(_2number(elem)).__name__) for elem in inputs]
+
+        return cls(column_tags, types)
+
+
+# Integer columns kept in 64 bits by compact loading (as well as *ID and
+# *_id columns)
+IDCOLUMNS = ['id', 'desc', 'p_start']
+
+
+def compacttype(tag, _type):
+    """Compact type of a column, 32 bits types except for ids and masses
+
+    Ids (IDCOLUMNS) need exact integers and masses (float columns starting
+    with m or M) are summed over many halos, so they keep their types.
+    Types are never widened.
+
+    Parameters
+    ----------
+    tag : str
+        Column tag
+    _type : numpy.dtype
+        Type of the column in the file
+    """
+
+    _type = np.dtype(_type)
+
+    if _type.itemsize <= 4:
+        return _type
+
+    if _type.kind in 'iu':
+        isid = tag in IDCOLUMNS or tag.endswith('ID') or tag.endswith('_id')
+        return _type if isid else np.dtype(np.int32)
+
+    return _type if tag[:1] in ('m', 'M') else np.dtype(np.float32)
+
+
+# Schemas of the already sniffed files, keyed by their column names line and
+# the number of columns of their data lines
+SCHEMAS = {}
+
+SNIFFLINES = 21 # Head of the ascii files, header and the first data lines
+
+
+def sniff(path, schema=None):
+    """Loading the header and the schema of a Rockstar ascii file with one
+    read of its head
+
+    The schema is inferred from line 20 of the file only for the first file
+    with a given column names line, later files share the cached schema.
+
+    Parameters
+    ----------
+    path : str
+    schema : RockstarSchema, optional
+        Skip the inference and use this schema instead
+
+    Returns
+    -------
+    header : dict
+    schema : RockstarSchema
+    """
+
+    with open(path) as _file:
+        lines = [_file.readline() for _ in range(SNIFFLINES)]
+
+    header = _parseheader(lines)
+    dataline = lines[20]
+
+    if schema is None and dataline.strip() != '':
+        key = (lines[0], len(dataline.split()))
+        if key not in SCHEMAS:
+            SCHEMAS[key] = RockstarSchema.fromlines(lines[0], dataline)
+        schema = SCHEMAS[key]
+    elif schema is None:
+        # Too few halos to infer the types from
+        schema = RockstarSchema(header['column_tags'],
+                                [np.dtype(float)] * len(header['column_tags']))
+
+    header['column_tags'] = list(schema.column_tags)
+
+    return header, schema
+
+
+def _parseheader(lines):
+    """Parsing the header lines of a Rockstar ascii file"""
+
+    header = {'units': {}}
+
+    for i, line in enumerate(lines):
+        line = line.strip('#').strip('\n')
+        if i == 0: # First line: column names
+            header['column_tags'] = line.split(' ')
+        elif 0 < i <= 2:
+            statements = line.split(';')
+            for statement in statements:
+                _extractkeyvalue(statement, '=', header)
+        elif 2 < i <= 8:
+            statements = line.split(';')
+            for statement in statements:
+                _extractkeyvalue(statement, ':', header)
+        elif 8 < i <= 15: # Units
+            if ' in ' in line:
+                delim = ' in '
+            elif ' is ' in line:
+                delim = ' is '
+            elif ' are ' in line:
+                delim = ' are '
+            else:
+                continue
+            parts = line.partition(':')[2].strip().partition(delim)
+            key = parts[0].strip().replace(' ', '_')
+            val = parts[2].strip()
+            header['units'][key] = val
+        elif i > 15:
+            break
+
+    return header
+
+
+# Header entries which should be the same in all blocks of a catalog
+_BLOCKKEYS = ['column_tags', 'a', 'Om', 'Ol', 'h', 'Box_size',
+              'Particle_mass']
+
+
+def _blockpaths(path):
+    """Expanding a glob pattern (or a list of paths) into a naturally sorted
+    list of paths, e.g. halos_0.2.ascii comes before halos_0.10.ascii"""
+
+    if not isinstance(path, str):
+        paths = list(path)
+    elif os.path.exists(path) or not glob.has_magic(path):
+        return [path]
+    else:
+        paths = glob.glob(path)
+
+    if len(paths) == 0:
+        raise IOError('No such file: ' + str(path))
+
+    return sorted(paths, key=lambda p: [int(t) if t.isdigit() else t
+                                        for t in re.split(r'(\d+)', p)])
+
+
 def _extractkeyvalue(statement, delimiter, dictionary):
     """Extracting data from a statement using a delimiter and inserting them
     into a given dictionary (headers)
@@ -0,0 +1,110 @@
+"""rockstar_test.py
+Checking Rockstar.load against the numpy.genfromtxt loader it replaced
+"""
+
+import numpy as np
+import pytest
+
+from .rockstar import Rockstar
+from .rockstarbin import COLUMNTAGS, HALODTYPE
+from .asciiparser import fieldnames
+from .catalogcache import CatalogCache
+
+
+HEADER = ['#a = 1.000000',
+          '#Om = 0.307115; Ol = 0.692885; h = 0.677700',
+          '#FOF linking length: 0.280000',
+          '#Unbound Threshold: 0.500000; FOF Refinement Threshold: 0.700000',
+          '#Particle mass: 1.00000e+09 Msun/h',
+          '#Box size: 100.000000 Mpc/h',
+          '#Force resolution assumed: 0.001 Mpc/h',
+          '#Units: Masses in Msun / h',
+          '#Units: Positions in Mpc / h (comoving)',
+          '#Units: Velocities in km / s (physical, peculiar)',
+          '#Units: Spins are dimensionless',
+          '#Units: Rs is kpc / h (comoving)']
+
+INTS = ['id', 'num_p', 'num_cp', 'p_start', 'desc', 'flags', 'n_core', 'PID']
+
+
+def _writecatalog(path, nhalos, seed=0):
+    """A Rockstar ascii catalog with all the columns of the binary files
+    and a PID column"""
+
+    rng = np.random.RandomState(seed)
+    tags = COLUMNTAGS + ['PID']
+
+    with open(str(path), 'w') as _file:
+        _file.write('\n'.join(['#' + ' '.join(tags)] + HEADER
+                              + ['#'] * (19 - 1 - len(HEADER))) + '\n')
+        for i in range(nhalos):
+            row = ['%d' % (i if tag == 'id' else rng.randint(-1, 1000))
+                   if tag in INTS else '%.5e' % rng.random_sample()
+                   for tag in tags]
+            _file.write(' '.join(row) + '\n')
+
+    return tags
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / 'halos_0.0.ascii'
+    tags = _writecatalog(path, 50)
+    types = [np.int64 if tag in INTS else np.float64 for tag in tags]
+
+    return str(path), np.genfromtxt(str(path), skip_header=19,
+                                    dtype=list(zip(tags, types)))
+
+
+def test_fieldnames(catalog):
+    path, expected = catalog
+    rockstar = Rockstar(path)
+    rockstar.load(nprocs=1)
+
+    assert rockstar.halos.dtype == expected.dtype
+    assert np.array_equal(rockstar.halos, expected)
+    assert 'TU' in rockstar.halos.dtype.names
+    assert list(HALODTYPE.names) == fieldnames(COLUMNTAGS)
+
+
+def test_selection(catalog):
+    path, expected = catalog
+    threshold = np.median(expected['TU'])
+
+    for only, where in ((['A[x]', 'T/|U|'], {'T/|U|': (threshold, None)}),
+                        (['Ax', 'TU'], {'TU': (threshold, None)})):
+        rockstar = Rockstar(path)
+        rockstar.load(only=only, where=where, nprocs=1)
+
+        keep = expected['TU'] >= threshold
+        assert rockstar.halos.dtype.names == ('Ax', 'TU')
+        np.testing.assert_array_equal(rockstar.halos['Ax'],
+                                      expected['Ax'][keep])
+
+    rockstar = Rockstar(path)
+    rockstar.load(exclude=['b_to_a(500c)', 'c_to_a500c'], nprocs=1)
+    assert 'b_to_a500c' not in rockstar.halos.dtype.names
+    assert 'c_to_a500c' not in rockstar.halos.dtype.names
+    assert len(rockstar.halos.dtype.names) == len(expected.dtype.names) - 2
+
+
+def test_halosinidorder(catalog):
+    path, expected = catalog
+    rockstar = Rockstar(path)
+    rockstar.load(only=['id', 'mvir'], nprocs=1)
+    rockstar.halos = rockstar.halos[::-1]
+
+    np.testing.assert_array_equal(rockstar.halosinidorder['mvir'],
+                                  expected['mvir'])
+    with pytest.raises(AttributeError):
+        rockstar.halossortedbyid
+
+
+def test_lazy_smallcache(catalog, tmp_path):
+    path, expected = catalog
+    cache = CatalogCache(str(tmp_path / 'cache'), maxsize=1)
+    rockstar = Rockstar(path)
+    rockstar.load(lazy=True, cache=cache, nprocs=1)
+
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(rockstar.halos[name], expected[name])
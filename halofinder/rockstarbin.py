@@ -0,0 +1,202 @@
+"""rockstarbin.py
+Loading Rockstar binary halo files (halos_*.bin). The layout follows
+rockstar/rockstar_data_type.h and column tags follow the ascii halo files.
+"""
+
+import numpy as np
+
+from .asciiparser import castcolumn, fieldnames, wheremask
+
+
+MAGIC = 0xfadedacec0c0d0d0
+HEADERSIZE = 256
+CHUNKSIZE = 1024**2 # Halos per chunk
+
+HEADERDTYPE = np.dtype([
+    ('magic', np.uint64),
+    ('snap', np.int64), ('chunk', np.int64),
+    ('scale', np.float32), ('Om', np.float32), ('Ol', np.float32),
+    ('h0', np.float32),
+    ('bounds', np.float32, (6,)),
+    ('num_halos', np.int64), ('num_particles', np.int64),
+    ('box_size', np.float32), ('particle_mass', np.float32),
+    ('particle_type', np.int64),
+    ('format_revision', np.int32),
+    ('rockstar_version', 'S12'),
+    ('unused', 'V144')])
+
+_FLOATS = [
+    'x', 'y', 'z', 'vx', 'vy', 'vz',
+    'corevel_x', 'corevel_y', 'corevel_z',
+    'bulk_vx', 'bulk_vy', 'bulk_vz',
+    'mvir', 'rvir', 'child_r', 'vmax_r', 'mbound_vir', 'vmax', 'rvmax', 'Rs',
+    'Rs_Klypin', 'vrms', 'Jx', 'Jy', 'Jz', 'E', 'Spin',
+    'm200b', 'm200c', 'm500c', 'm2500c',
+    'Xoff', 'Voff', 'b_to_a', 'c_to_a', 'A[x]', 'A[y]', 'A[z]',
+    'b_to_a(500c)', 'c_to_a(500c)', 'A[x](500c)', 'A[y](500c)', 'A[z](500c)',
+    'spin_bullock', 'T/|U|', 'M_pe_Behroozi', 'M_pe_Diemer',
+    'Halfmass_Radius']
+
+_INTS = ['num_p', 'num_cp', 'p_start', 'desc', 'flags', 'n_core']
+
+_ERRORS = ['PosUncertainty', 'VelUncertainty', 'BulkVelUnc']
+
+# Column tags of the halos, as in the ascii files
+COLUMNTAGS = ['id'] + _FLOATS + _INTS + _ERRORS
+
+# Same as the (aligned) rockstarhalo struct, fields are named after the
+# column tags as in the arrays loaded from the ascii files (see fieldnames)
+HALODTYPE = np.dtype(
+    list(zip(fieldnames(COLUMNTAGS),
+             [np.int64] + [np.float32] * len(_FLOATS)
+             + [np.int64] * len(_INTS) + [np.float32] * len(_ERRORS))),
+    align=True)
+
+
+def isrockstarbin(path):
+    """Checking the magic number of a file"""
+
+    with open(path, 'rb') as _file:
+        magic = np.fromfile(_file, dtype=np.uint64, count=1)
+
+    return len(magic) == 1 and magic[0] == MAGIC
+
+
+def loadheader(path):
+    """Loading the header of a Rockstar binary file
+
+    Returns
+    -------
+    dict
+        Same keys (and string values) as the header of the ascii files, plus
+        the binary only attributes
+    """
+
+    with open(path, 'rb') as _file:
+        raw = np.fromfile(_file, dtype=HEADERDTYPE, count=1)
+
+    if len(raw) != 1 or raw['magic'][0] != MAGIC:
+        raise IOError(path + ' is not a Rockstar binary file')
+
+    raw = raw[0]
+
+    return {
+        'units': {
+            'Masses': 'Msun / h',
+            'Positions': 'Mpc / h (comoving)',
+            'Velocities': 'km / s (physical, peculiar)',
+            'Angular_Momenta': '(Msun/h) * (Mpc/h) * km/s (physical)',
+            'Spins': 'dimensionless',
+            '[Rs]': 'kpc / h (comoving)'},
+        'column_tags': list(COLUMNTAGS),
+        'a': [str(raw['scale'])],
+        'Om': [str(raw['Om'])],
+        'Ol': [str(raw['Ol'])],
+        'h': [str(raw['h0'])],
+        'Particle_mass': [str(raw['particle_mass']), 'Msun/h'],
+        'Box_size': [str(raw['box_size']), 'Mpc/h'],
+        'Bounds': [str(b) for b in raw['bounds']],
+        'Snapshot': [str(raw['snap'])],
+        'Chunk': [str(raw['chunk'])],
+        'Number_of_halos': [str(raw['num_halos'])],
+        'Number_of_particles': [str(raw['num_particles'])],
+        'Rockstar_Version': [raw['rockstar_version'].decode('ascii', 'ignore')
+                             .strip('\x00')]}
+
+
+def loadhalos(path, dtype, where=None, chunksize=CHUNKSIZE, blocktag=None):
+    """Loading (selected columns of) halos of a Rockstar binary file
+
+    Parameters
+    ----------
+    path : str or list of str
+        Path to the binary file, or to several blocks loaded into one array
+    dtype : list of (str, numpy.dtype)
+        Datatype of the output array, names should be in HALODTYPE (except
+        blocktag)
+    where : dict, optional
+        Filters applied to each chunk of halos, mapping a field name of
+        HALODTYPE to either a value or a (min, max) tuple (both inclusive, None for an open end)
+    chunksize : int, optional
+        Number of halos filtered and converted at once
+    blocktag : str, optional
+        A field of dtype to fill with the index of the file of each halo
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    paths = [path] if isinstance(path, str) else path
+    nhalos = sum(int(loadheader(p)['Number_of_halos'][0]) for p in paths)
+
+    if where:
+        chunks = list(iterhalos(paths, dtype, where=where,
+                                chunksize=chunksize, blocktag=blocktag))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+
+    output = np.empty(nhalos, dtype=dtype)
+    filled = 0
+
+    for block, chunk in _rawchunks(paths, chunksize):
+        _convert(chunk, output[filled:filled + len(chunk)], block, blocktag)
+        filled += len(chunk)
+
+    return output
+
+
+def iterhalos(path, dtype, where=None, chunksize=CHUNKSIZE, blocktag=None):
+    """Loading halos of Rockstar binary file(s) chunk by chunk
+
+    Same parameters as loadhalos
+
+    Yields
+    ------
+    numpy.ndarray
+        Converted (and filtered) halos of each chunk
+    """
+
+    paths = [path] if isinstance(path, str) else path
+    where = sorted(where.items()) if where else []
+
+    for block, chunk in _rawchunks(paths, chunksize):
+        if where:
+            chunk = chunk[wheremask(chunk, where)]
+
+        converted = np.empty(len(chunk), dtype=dtype)
+        _convert(chunk, converted, block, blocktag)
+
+        yield converted
+
+
+def _rawchunks(paths, chunksize):
+    """Memory-mapped chunks of halos of a list of binary files
+
+    Yields
+    ------
+    block : int
+        Index of the file
+    chunk : numpy.memmap
+        Halos with HALODTYPE
+    """
+
+    for block, path in enumerate(paths):
+        nhalos = int(loadheader(path)['Number_of_halos'][0])
+        if nhalos == 0:
+            continue
+
+        halos = np.memmap(path, dtype=HALODTYPE, mode='r', offset=HEADERSIZE,
+                          shape=(nhalos,))
+
+        for begin in range(0, nhalos, chunksize):
+            yield block, halos[begin:begin + chunksize]
+
+
+def _convert(chunk, converted, block, blocktag):
+    """Copying the columns of raw halos into the output datatype"""
+
+    for tag in converted.dtype.names:
+        if tag == blocktag:
+            converted[tag] = block
+        else:
+            castcolumn(converted, tag, chunk[tag])
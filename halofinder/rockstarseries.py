@@ -0,0 +1,249 @@
+"""rockstarseries.py
+Managing the Rockstar catalogs of all the snapshots of a simulation: indexing
+them by scale factor, loading them on demand and keeping the recently used
+ones in memory
+"""
+
+import os
+import glob
+import json
+import atexit
+import shutil
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+
+from .catalogcache import CatalogCache
+from .rockstar import Rockstar
+
+
+MAXMEMORY = int(os.environ.get('MYTOOLS_SERIES_MAXMEMORY',
+                               8 * 1024**3)) # Bytes
+
+
+class RockstarSeries(object):
+    """Snapshot series of Rockstar catalogs
+
+    Catalogs are indexed by the scale factor in their headers; blocks of the
+    same snapshot (e.g. halos_12.0.ascii, halos_12.1.ascii) are loaded as one
+    catalog. All the files of a run share one sniffed schema.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the catalogs
+    pattern : str, optional
+        Glob pattern of the catalogs inside the directory
+    maxmemory : int, optional
+        Memory cap in bytes of the resident catalogs, default is MAXMEMORY
+        (which can be set through the MYTOOLS_SERIES_MAXMEMORY environment
+        variable). Least recently used catalogs are dropped to stay below it.
+        Memory-mapped catalogs count with their full size and columnar ones
+        with the columns accessed so far
+    prefetch : bool, optional
+        Load the next snapshot (with the same selection) in a background
+        process after each load. The process stores the catalog in the
+        cache of the selection (the cache or lazy arguments of
+        Rockstar.load), or in a temporary cache of the series, and the
+        catalog is then memory-mapped from there. No thread is left behind,
+        so the loaded catalogs can be used with process pools. A prefetch
+        which is not the next requested snapshot is cancelled
+
+    Attributes
+    ----------
+    self.scales : numpy.ndarray
+        Sorted scale factors of the snapshots
+    self.paths : dict
+        Paths of the files of each scale factor
+
+    Examples
+    --------
+    >>> from mytools.halofinder.rockstarseries import RockstarSeries
+    >>> series = RockstarSeries('/path/to/rockstar/dir', 'halos_*.ascii',
+    ...                         maxmemory=4 * 1024**3)
+    >>> rockstar = series.get(0.5, only=['id', 'mvir'], onlyhosts=True)
+    >>> for rockstar in series.iterate(only=['id', 'mvir']):
+    ...     print(rockstar.header['a'], len(rockstar.halos))
+    """
+
+    def __init__(self, directory, pattern='*.ascii', maxmemory=None,
+                 prefetch=True):
+        """Constructor for RockstarSeries class"""
+
+        self.maxmemory = MAXMEMORY if maxmemory is None else maxmemory
+        self.prefetch = prefetch
+
+        self.paths = {}
+        for path in glob.glob(os.path.join(directory, pattern)):
+            scale = float(Rockstar(path).header['a'][0])
+            self.paths.setdefault(scale, []).append(path)
+
+        if len(self.paths) == 0:
+            raise IOError('No catalogs matching ' +
+                          os.path.join(directory, pattern))
+
+        self.scales = np.array(sorted(self.paths))
+
+        self._resident = OrderedDict()
+        self._pending = {}
+        self._tmpcache = None
+
+    def __len__(self):
+        return len(self.scales)
+
+    def __getitem__(self, i):
+        """Loading the i-th snapshot with all the columns"""
+
+        return self.get(self.scales[i])
+
+    def nearest(self, scale):
+        """The scale factor of the snapshot closest to a given one"""
+
+        return self.scales[np.argmin(np.abs(self.scales - scale))]
+
+    def get(self, scale, **kwargs):
+        """Loading (or reusing) the catalog of a snapshot
+
+        Parameters
+        ----------
+        scale : float
+            Scale factor, the closest snapshot is loaded
+        **kwargs
+            Arguments of Rockstar.load, e.g. only=['mvir'], onlyhosts=True
+
+        Returns
+        -------
+        Rockstar
+        """
+
+        return self._get(scale, kwargs, 1)
+
+    def iterate(self, reverse=False, **kwargs):
+        """Loading the snapshots one by one, in the order of their scale
+        factors (or the reverse), see RockstarSeries.get"""
+
+        step = -1 if reverse else 1
+
+        for scale in self.scales[::step]:
+            yield self._get(scale, kwargs, step)
+
+    def _get(self, scale, kwargs, step):
+        """Loading a catalog and prefetching its neighbour in the direction
+        of step"""
+
+        scale = self.nearest(scale)
+        key = _key(scale, kwargs)
+
+        # Prefetches of other catalogs are not needed anymore
+        self._cancel([k for k in self._pending if k != key])
+
+        rockstar = self._resident.pop(key, None)
+        if rockstar is not None:
+            self._resident[key] = rockstar
+        elif key in self._pending:
+            process, cached = self._pending.pop(key)
+            process.join()
+            # Memory-mapped from the cache, or parsed again if the
+            # prefetch failed
+            rockstar = self._load(key, scale, cached)
+        else:
+            rockstar = self._load(key, scale, kwargs)
+
+        i = np.searchsorted(self.scales, scale) + step
+        if self.prefetch and 0 <= i < len(self.scales):
+            self._prefetch(self.scales[i], kwargs)
+
+        return rockstar
+
+    def residentsize(self):
+        """Total size of the resident catalogs in bytes"""
+
+        return sum(_nbytes(r) for r in self._resident.values())
+
+    def clear(self):
+        """Dropping all the resident catalogs and cancelling the
+        prefetches"""
+
+        self._cancel(list(self._pending))
+        self._resident.clear()
+
+    def _load(self, key, scale, kwargs):
+        """Loading a catalog and making room for it"""
+
+        rockstar = Rockstar(self.paths[scale])
+        rockstar.load(**kwargs)
+
+        self._resident[key] = rockstar
+        self._evict()
+
+        return rockstar
+
+    def _evict(self):
+        """Dropping least recently used catalogs (except the most recent
+        one) while over the memory cap"""
+
+        total = sum(_nbytes(r) for r in self._resident.values())
+
+        while total > self.maxmemory and len(self._resident) > 1:
+            _, rockstar = self._resident.popitem(last=False)
+            total -= _nbytes(rockstar)
+
+    def _prefetch(self, scale, kwargs):
+        """Loading a snapshot into a cache in a background process"""
+
+        key = _key(scale, kwargs)
+
+        if key in self._resident or key in self._pending:
+            return
+
+        cached = dict(kwargs)
+        if not kwargs.get('cache') and not kwargs.get('lazy'):
+            cached['cache'] = self._privatecache()
+
+        # A single parsing process, to leave the cpus to the foreground
+        process = multiprocessing.Process(
+            target=_prefetchload,
+            args=(self.paths[scale], dict(cached, nprocs=1)))
+        process.daemon = True
+        process.start()
+
+        self._pending[key] = (process, cached)
+
+    def _cancel(self, keys):
+        """Stopping the prefetches of some catalogs"""
+
+        for key in keys:
+            process, _ = self._pending.pop(key)
+            process.terminate()
+            process.join()
+
+    def _privatecache(self):
+        """Temporary cache of the prefetched catalogs, removed at exit"""
+
+        if self._tmpcache is None:
+            cachedir = tempfile.mkdtemp(prefix='rockstarseries-')
+            atexit.register(shutil.rmtree, cachedir, True)
+            self._tmpcache = CatalogCache(cachedir, maxsize=self.maxmemory)
+
+        return self._tmpcache
+
+
+def _prefetchload(paths, kwargs):
+    """Body of the prefetching processes, storing a catalog in a cache"""
+
+    Rockstar(paths).load(**kwargs)
+
+
+def _key(scale, kwargs):
+    """Key of a loaded catalog, its scale factor and selection"""
+
+    return (float(scale), json.dumps(kwargs, sort_keys=True, default=str))
+
+
+def _nbytes(rockstar):
+    """Memory used by the halos of a catalog, counting the whole of
+    memory-mapped ones and the accessed columns of columnar ones"""
+
+    return getattr(rockstar.halos, 'nbytes', 0)
@@ -0,0 +1,239 @@
+"""spatialindex.py
+Periodic KD-tree on halo positions for radius, nearest neighbour, pair
+counting and environment queries
+"""
+
+from itertools import chain
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .idindex import NOTAVLBL
+
+
+class SpatialIndex(object):
+    """Periodic spatial index of halo positions
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+        Positions of the halos, shape (n, 3)
+    boxsize : float, optional
+        Size of the periodic box, in the same units as positions. Positions
+        are wrapped into [0, boxsize). None for a non-periodic index
+    leafsize : int, optional
+        Number of points in the leaves of the tree
+    workers : int, optional
+        Number of threads used by the queries, -1 for all the cpus
+
+    Examples
+    --------
+    >>> from mytools.halofinder.spatialindex import SpatialIndex
+    >>> index = SpatialIndex(np.column_stack((x, y, z)), boxsize=100.0)
+    >>> offsets, rows = index.within([[50., 50., 50.]], 2.0)
+    >>> distances, rows = index.nearest(k=4)
+    """
+
+    def __init__(self, positions, boxsize=None, leafsize=16, workers=-1):
+        """Constructor for SpatialIndex class"""
+
+        self.boxsize = boxsize
+        self.workers = workers
+        self.npoints = len(positions)
+
+        # An unbalanced tree (sliding midpoint splits) builds several times
+        # faster and queries as fast on halo catalogs
+        self.tree = cKDTree(self._wrap(positions), leafsize=leafsize,
+                            boxsize=boxsize, balanced_tree=False,
+                            compact_nodes=False)
+
+    def _wrap(self, points):
+        """Converting points to a (n, 3) float64 array inside the box"""
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+
+        if self.boxsize is not None:
+            points = np.mod(points, self.boxsize)
+            # Rounding of mod may result in exactly boxsize
+            points[points >= self.boxsize] = 0.0
+
+        return points
+
+    def within(self, points, r):
+        """Finding the halos within a distance of each point
+
+        Parameters
+        ----------
+        points : numpy.ndarray
+            Query points, shape (m, 3)
+        r : float or array of float
+            Search radius, or one radius per point
+
+        Returns
+        -------
+        offsets : numpy.ndarray of int
+            Halos around point i are rows[offsets[i]:offsets[i + 1]]
+        rows : numpy.ndarray of int
+        """
+
+        neighbours = self.tree.query_ball_point(self._wrap(points), r,
+                                                workers=self.workers)
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.intp,
+                             count=len(neighbours))
+
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        rows = np.fromiter(chain.from_iterable(neighbours), dtype=np.intp,
+                           count=offsets[-1])
+
+        return offsets, rows
+
+    def countwithin(self, points, r):
+        """Number of halos within a distance of each point"""
+
+        return self.tree.query_ball_point(self._wrap(points), r,
+                                          workers=self.workers,
+                                          return_length=True)
+
+    def nearest(self, points=None, k=1):
+        """Finding the k nearest halos of each point
+
+        Parameters
+        ----------
+        points : numpy.ndarray, optional
+            Query points, shape (m, 3). By default the neighbours of the
+            indexed halos themselves (excluding each halo) are returned
+        k : int, optional
+
+        Returns
+        -------
+        distances : numpy.ndarray
+            Shape (m, k), inf for missing neighbours
+        rows : numpy.ndarray of int
+            Shape (m, k), NOTAVLBL for missing neighbours
+        """
+
+        if points is None:
+            distances, rows = self.tree.query(self.tree.data, k=k + 1,
+                                              workers=self.workers)
+            distances, rows = _dropself(distances.reshape(-1, k + 1),
+                                        rows.reshape(-1, k + 1))
+        else:
+            distances, rows = self.tree.query(self._wrap(points),
+                                              k=list(range(1, k + 1)),
+                                              workers=self.workers)
+
+        rows = rows.astype(np.int64)
+        rows[rows == self.npoints] = NOTAVLBL
+
+        return distances, rows
+
+    def pairs(self, r):
+        """Pairs of halos closer than r to each other
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Shape (npairs, 2), each pair appears once with i < j
+        """
+
+        return self.tree.query_pairs(r, output_type='ndarray')
+
+    def paircount(self, r, other=None):
+        """Counting pairs of halos with separations <= r
+
+        Parameters
+        ----------
+        r : float or array of float
+        other : SpatialIndex, optional
+            Count the pairs between the two indices (in the same box)
+            instead of the distinct pairs of this index
+
+        Returns
+        -------
+        int or numpy.ndarray of int
+            Number of pairs for each r
+        """
+
+        if other is not None:
+            return self.tree.count_neighbors(other.tree, r)
+
+        # Each pair is counted twice, and each halo is paired with itself
+        counts = self.tree.count_neighbors(self.tree, r)
+        return (np.asarray(counts) - self.npoints) // 2
+
+    def mostmassive(self, mass, r, points=None):
+        """Finding the most massive neighbour of each halo (or point)
+
+        Parameters
+        ----------
+        mass : numpy.ndarray
+            Mass (or any other property) of the indexed halos
+        r : float
+            Search radius
+        points : numpy.ndarray, optional
+            Query points, shape (m, 3). By default the neighbours of the
+            indexed halos themselves (excluding each halo) are searched
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Row of the most massive neighbour, NOTAVLBL if there is none
+
+        Examples
+        --------
+        >>> rows = index.mostmassive(halos['mvir'], 1.0)
+        >>> isolated = (rows == NOTAVLBL) | \\
+        ...            (halos['mvir'][rows] <= halos['mvir'])
+        """
+
+        mass = np.asarray(mass)
+
+        if points is None:
+            pairs = self.pairs(r)
+            segments = np.concatenate((pairs[:, 0], pairs[:, 1]))
+            rows = np.concatenate((pairs[:, 1], pairs[:, 0]))
+            nsegments = self.npoints
+        else:
+            offsets, rows = self.within(points, r)
+            nsegments = len(offsets) - 1
+            segments = np.repeat(np.arange(nsegments), np.diff(offsets))
+
+        return _segmentargmax(segments, rows, mass[rows], nsegments)
+
+
+def _dropself(distances, rows):
+    """Removing each halo from its own list of k + 1 nearest neighbours"""
+
+    isself = rows == np.arange(len(rows))[:, None]
+
+    # Halos with k duplicates closer than themselves, drop the farthest one
+    isself[~isself.any(axis=1), -1] = True
+
+    shape = (len(rows), rows.shape[1] - 1)
+
+    return distances[~isself].reshape(shape), rows[~isself].reshape(shape)
+
+
+def _segmentargmax(segments, rows, values, nsegments):
+    """Finding the row with the largest value in each segment
+
+    Returns
+    -------
+    numpy.ndarray of int
+        One row per segment, NOTAVLBL for empty segments
+    """
+
+    result = np.full(nsegments, NOTAVLBL, dtype=np.int64)
+
+    if len(segments) == 0:
+        return result
+
+    # Sorting by segment and then by value, the last element of each segment
+    # is the largest one
+    order = np.lexsort((values, segments))
+    segments = segments[order]
+    last = np.append(np.flatnonzero(np.diff(segments)), len(segments) - 1)
+
+    result[segments[last]] = rows[order[last]]
+
+    return result
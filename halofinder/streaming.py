@@ -0,0 +1,176 @@
+"""streaming.py
+Reducers consuming a catalog chunk by chunk (e.g. Rockstar.iterchunks), for
+catalogs larger than the memory
+"""
+
+import numpy as np
+
+from .binning import binindex
+
+
+class StreamingHistogram(object):
+    """Histogram of values, edges[i] < value <= edges[i + 1]
+
+    Parameters
+    ----------
+    edges : array of float
+        Sorted bin edges
+
+    Examples
+    --------
+    >>> from mytools.halofinder.streaming import StreamingHistogram
+    >>> hist = StreamingHistogram(np.logspace(10, 15, num=21))
+    >>> for chunk in rockstar.iterchunks(['mvir']):
+    ...     hist.update(chunk['mvir'])
+    >>> hist.counts
+    """
+
+    def __init__(self, edges):
+        """Constructor for StreamingHistogram class"""
+
+        self.edges = np.asarray(edges)
+        self.nbins = len(self.edges) - 1
+        self.counts = np.zeros(self.nbins, dtype=np.int64)
+        self.weights = np.zeros(self.nbins)
+
+    def update(self, values, weights=None):
+        """Adding a chunk of values (and their weights)"""
+
+        idx = binindex(values, self.edges)
+        inside = idx >= 0
+
+        self.counts += np.bincount(idx[inside], minlength=self.nbins)
+        if weights is not None:
+            self.weights += np.bincount(idx[inside],
+                                        weights=np.asarray(weights)[inside],
+                                        minlength=self.nbins)
+
+
+class StreamingBinnedStats(object):
+    """Count, mean and standard deviation of y in bins of x,
+    edges[i] < x <= edges[i + 1]
+
+    Chunks are merged with the pairwise update of Chan et al. (1979), so the
+    standard deviation is as accurate as the one of binning.binnedstats.
+    Medians and percentiles need all the values and are not available.
+
+    Parameters
+    ----------
+    edges : array of float
+        Sorted bin edges of x
+    """
+
+    def __init__(self, edges):
+        """Constructor for StreamingBinnedStats class"""
+
+        self.edges = np.asarray(edges)
+        self.nbins = len(self.edges) - 1
+        self.count = np.zeros(self.nbins, dtype=np.int64)
+        self._mean = np.zeros(self.nbins)
+        self._m2 = np.zeros(self.nbins)
+
+    def update(self, x, y):
+        """Adding a chunk of (x, y) pairs"""
+
+        idx = binindex(x, self.edges)
+        inside = idx >= 0
+        idx, y = idx[inside], np.asarray(y, dtype=np.float64)[inside]
+
+        count = np.bincount(idx, minlength=self.nbins)
+        mean = np.bincount(idx, weights=y, minlength=self.nbins) \
+               / np.maximum(count, 1)
+        m2 = np.bincount(idx, weights=(y - mean[idx])**2,
+                         minlength=self.nbins)
+
+        total = self.count + count
+        delta = mean - self._mean
+        ratio = count / np.maximum(total, 1).astype(np.float64)
+
+        self._m2 += m2 + delta**2 * self.count * ratio
+        self._mean += delta * ratio
+        self.count = total
+
+    def result(self):
+        """Statistics of the consumed chunks
+
+        Returns
+        -------
+        dict
+            'count', 'mean' and 'std' with one element per bin, NaN for
+            empty bins
+        """
+
+        empty = self.count == 0
+
+        mean = np.where(empty, np.nan, self._mean)
+        std = np.where(empty, np.nan,
+                       np.sqrt(self._m2 / np.maximum(self.count, 1)))
+
+        return {'count': self.count.copy(), 'mean': mean, 'std': std}
+
+
+class StreamingMinMax(object):
+    """Minimum and maximum of values (None before the first update)"""
+
+    def __init__(self):
+        """Constructor for StreamingMinMax class"""
+
+        self.min, self.max = None, None
+
+    def update(self, values):
+        """Adding a chunk of values"""
+
+        if len(values) == 0:
+            return
+
+        vmin, vmax = np.min(values), np.max(values)
+
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+
+class StreamingTopK(object):
+    """The k records with the largest values
+
+    Parameters
+    ----------
+    k : int
+    tag : str
+        Field of the chunks to rank the records by
+
+    Examples
+    --------
+    >>> top = StreamingTopK(10, 'mvir')
+    >>> for chunk in rockstar.iterchunks(['id', 'mvir']):
+    ...     top.update(chunk)
+    >>> top.result()['id']
+    """
+
+    def __init__(self, k, tag):
+        """Constructor for StreamingTopK class"""
+
+        self.k = k
+        self.tag = tag
+        self.records = None
+
+    def update(self, chunk):
+        """Adding a chunk of records (a structured array)"""
+
+        if self.records is not None:
+            chunk = np.concatenate((self.records, chunk))
+
+        if len(chunk) > self.k:
+            keep = np.argpartition(chunk[self.tag], len(chunk) - self.k)
+            chunk = chunk[keep[len(chunk) - self.k:]]
+
+        self.records = chunk
+
+    def result(self):
+        """Records sorted by decreasing value"""
+
+        if self.records is None:
+            return None
+
+        order = np.argsort(self.records[self.tag], kind='mergesort')[::-1]
+
+        return self.records[order]
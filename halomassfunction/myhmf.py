@@ -5,6 +5,8 @@ Main module for generating halo mass function
 
 import numpy as np
 
+from ..halofinder.streaming import StreamingMinMax
+
 
 class MyHMF(object):
     """Halo mass function class"""
@@ -14,8 +16,9 @@ class MyHMF(object):
 
         Parameters
         ----------
-        halomasses : Array of float
-            Masses of halos
+        halomasses : Array of float or callable
+            Masses of halos, or a function returning an iterable of arrays
+            of masses (called twice) for catalogs larger than the memory
         boxlength : float
             Length of the simulation box
 
@@ -34,6 +37,12 @@ class MyHMF(object):
         -------
         hmf()
             Generating the halo mass function
+
+        Examples
+        --------
+        >>> hmf = MyHMF(rockstar.halos['mvir'], 100)
+        >>> hmf = MyHMF(lambda: (c['mvir'] for c in rockstar.iterchunks(
+        ...     ['mvir'], where={'PID': -1})), 100)
         """
 
         self.halos = halomasses
@@ -52,21 +61,23 @@ class MyHMF(object):
         key : str
         """
 
+        chunks = self.halos if callable(self.halos) else lambda: [self.halos]
+
+        minmax = StreamingMinMax()
+        for masses in chunks():
+            minmax.update(masses)
+
         bin_edges = np.logspace(
-            np.log10(np.min(self.halos)),
-            np.log10(np.max(self.halos)),
+            np.log10(minmax.min),
+            np.log10(minmax.max),
             num=nbins+1,
             base=10)
 
-        n, hist = [], []
-
-        for bmin, bmax in zip(bin_edges[:-1], bin_edges[1:]):
-            binned_hosts = [h for h in self.halos if h >= bmin and h < bmax]
-            n.append(len(binned_hosts))
-            if len(binned_hosts) != 0:
-                hist.append(np.mean(binned_hosts))
-            else:
-                hist.append(0)
+        # Bins are bmin <= m < bmax
+        n = np.zeros(nbins, dtype=np.int64)
+        for masses in chunks():
+            idx = np.searchsorted(bin_edges, masses, side='right') - 1
+            n += np.bincount(idx[(idx >= 0) & (idx < nbins)], minlength=nbins)
 
         self.m = [
             10**((np.log10(minm * maxm)) / 2)
@@ -8,11 +8,13 @@ from math import sqrt, pi
 from scipy.interpolate import InterpolatedUnivariateSpline as interpolate
 import numpy as np
 
+from ..simulation.mortonindex import rangerows
+
 
 class MyHMP(object):
     """MyHMP (Halo mass profile) class"""
 
-    def __init__(self, halos, sorted_particles, p_mass):
+    def __init__(self, halos, sorted_particles, p_mass, index=None):
         """Constructor for MyHMP
 
         Parameters
@@ -20,9 +22,13 @@ class MyHMP(object):
         halos : numpy.ndarray
             Numpy array of halos data containing x, y, z, rvir
         sorted_particles : numpy.ndarray
-            Array of particles sorted  based on their x position
+            Array of particles sorted  based on their x position (or along
+            the Morton curve of index)
         particles_mass : float
             Particles' mass
+        index : MortonIndex, optional
+            Morton index of the particles, e.g. Gadget.spatialindex after
+            Gadget.load(sorting=True, col='morton')
         cosmo : str, optional
             Name of cosmology to use (from astropy package)
 
@@ -47,6 +53,7 @@ class MyHMP(object):
         self.halos = halos
         self.particles = sorted_particles
         self.pmass = p_mass
+        self.index = index
         self.profiles = []
         self.rho_rhocrit = []
         self.rr200 = []
@@ -70,7 +77,11 @@ class MyHMP(object):
             _write('\rGenerating halo mass profile [%d out of %d]',
                    (i + 1, len(self.halos)))
 
-            sorted_distances = _sorteddistances(halo, self.particles)
+            if self.index is None:
+                sorted_distances = _sorteddistances(halo, self.particles)
+            else:
+                sorted_distances = _indexeddistances(halo, self.particles,
+                                                     self.index)
 
             self.profiles.append(_densitycalc(
                 sorted_distances, rbins, self.pmass, rhocritperh))
@@ -127,6 +138,37 @@ def _sorteddistances(halo, sorted_particles):
     return np.sort(result)
 
 
+def _indexeddistances(halo, particles, index):
+    """Calculating the distance of the particles in the cube of side 2 * rvir
+    around the center of the halo, reading only the cells of the cube
+
+    Parameters
+    ----------
+    halo : numpy.array
+    particles : numpy.ndarray
+        Particles in the order of index
+    index : MortonIndex
+
+    Returns
+    -------
+    array of float
+    """
+
+    center = np.array([halo['x'], halo['y'], halo['z']], dtype=np.float64)
+    r = halo['rvir']
+
+    rows = rangerows(index.box(center - r, center + r))
+    delta = np.column_stack((particles['x'][rows], particles['y'][rows],
+                             particles['z'][rows])) - center
+
+    if index.periodic:
+        delta = (delta + index.size / 2.0) % index.size - index.size / 2.0
+
+    incube = np.all(np.abs(delta) < r, axis=1)
+
+    return np.sort(np.sqrt(np.sum(delta[incube]**2, axis=1)))
+
+
 def _densitycalc(sorted_distances, rbins, pmass, rhocritperh):
     """Calculating halo mass profile
 
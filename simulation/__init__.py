@@ -1,3 +1,3 @@
 """Simulation"""
 
-__all__ = ['gadget']
+__all__ = ['gadget', 'gadgetwriter', 'mortonindex', 'synthetic']
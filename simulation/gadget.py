@@ -1,9 +1,44 @@
 """gadget.py
 Loading Gadget snapshot"""
 
+import os
+import re
 import struct
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import numpy  as np
 
+from .mortonindex import MortonIndex
+from ..halofinder.idindex import IdIndex
+from ..halofinder.catalogcache import CatalogCache
+
+
+# Positions as a structured view of the float32 (N, 3) position block
+POSDTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('z', np.float32)])
+
+# Header of a snapshot file: npart, massarr, time, redshift, flag_sfr,
+# flag_feedback, npartTotal, flag_cooling, NumFiles, BoxSize, Omega0,
+# OmegaLambda, HubbleParam, flag_stellarage, flag_metals and
+# npartTotalHighWord, padded to 256 bytes
+HEADERFORMAT = '6i8d2i6I2i4d2i6I'
+
+# Size of the block labels of SnapFormat=2 files: the name of the block
+# (padded to 4 characters) and the size in bytes of the next record
+LABELBYTES = 8
+
+# Default number of particles of the chunks of Gadget.iterblock, 12MB of
+# positions
+CHUNKPARTICLES = 1024**2
+
+# Particle types, in the order of the header and the blocks
+PTYPES = ['gas', 'halo', 'disk', 'bulge', 'stars', 'bndry']
+
+# Blocks of a format 1 snapshot, in the order of the file. MASS only exists
+# if the mass table has a zero entry for a type with particles
+BLOCKNAMES = ['HEAD', 'POS', 'VEL', 'ID', 'MASS']
+
+
 class Gadget(object):
     """Tool for loading and manipulating Gadget 2 snapshot.
 
@@ -12,22 +47,203 @@ class Gadget(object):
     Parameters
     ----------
     path : str
-        Path to the gadget snapshot
+        Path to the gadget snapshot, SnapFormat 1 or 2 (with labelled
+        blocks, detected automatically). Snapshots split into several files
+        (snapshot_000.0, snapshot_000.1, ...) are detected from NumFiles in
+        the header and can be given by their base name or any of their files
+    mmap : bool, optional
+        Memory-map the blocks of the snapshot instead of reading them.
+        Gadget.positions, velocities, ids and masses are then np.memmap
+        views into the file (unless the selected particles span several
+        ranges or files), and only the touched pages are read
+    types : list of str, optional
+        Only read particles of these types (see PTYPES), e.g. ['halo'].
+        Particles of the other types are skipped by their byte offsets
+    nthreads : int, optional
+        Number of threads reading the files of a multi-file snapshot,
+        default is one per file (up to the number of cpus)
+
+    Attributes
+    ----------
+    self.paths : list of str
+        Files of the snapshot
+    self.headers : dict
+        Header of the snapshot, merged from all its files: 'particles' and
+        'nparticles' count the particles of all the files
+    self.format : int
+        SnapFormat of the snapshot, 1 or 2
+    self.blocks : dict
+        Offset (of the first byte after the record marker) and size in bytes
+        of each block of the first file, e.g. self.blocks['POS']. Format 2
+        files may list blocks beyond BLOCKNAMES (by their stripped labels)
+    self.velocities, self.ids, self.masses : numpy.ndarray
+        Read from the file the first time they are accessed. Masses of the
+        types with a non-zero entry in the mass table come from the table
+    self.order : numpy.ndarray of int
+        After a sorted load, positions[i] is the particle order[i] of the
+        file (and of velocities, ids and masses)
 
     Examples
     --------
     >>> from mytools.simulation.gadget import Gadget
     >>> gadget = Gadget('/path/to/gadget/snapshot')
+    >>> gadget = Gadget('/path/to/gadget/snapshot', mmap=True)
+    >>> slab = gadget.positions[:, 0] < 10.0
+    >>> gadget = Gadget('/path/to/gadget/snapshot', types=['halo'])
+    >>> gadget.load()
+    >>> gadget.velocities
+    >>> gadget = Gadget('/path/to/gadget/snapshot_005') # snapshot_005.{0..N}
     """
 
-    def __init__(self, path):
+    def __init__(self, path, mmap=False, types=None, nthreads=None):
         """Initializing"""
-        self._file = open(path, 'rb')
-        self.headers = self._readheader()
+        self.paths = _snapshotpaths(path)
+        self.path = self.paths[0]
+        self.mmap = mmap
+        self.nthreads = nthreads
         self.data = []
-        self.dtype = np.dtype([('x', np.float64),
-                               ('y', np.float64),
-                               ('z', np.float64)])
+        self.positions = None
+        self.order, self.spatialindex = None, None
+        self.idindex = None
+        self.dtype = POSDTYPE
+        self._lazyblocks = {}
+
+        # Header and block directory of each file
+        self._parts = []
+        for partpath in self.paths:
+            with open(partpath, 'rb') as _file:
+                headers = _readheader(_file)
+            snapformat = _snapformat(partpath)
+            self._parts.append({
+                'path': partpath,
+                'headers': headers,
+                'format': snapformat,
+                'blocks': _blockdirectory(partpath,
+                                          _blocknames(headers['particles']),
+                                          snapformat)
+            })
+
+        self.headers = _mergeheaders([p['headers'] for p in self._parts])
+        self.blocks = self._parts[0]['blocks']
+        self.format = self._parts[0]['format']
+
+        types = PTYPES if types is None else types
+        for ptype in types:
+            if ptype not in PTYPES:
+                raise KeyError('Unknown particle type: ' + ptype)
+
+        # In the order of the file
+        self.types = [t for t in PTYPES if t in types]
+
+        self.nselected = sum(self.headers['particles'][t][0]
+                             for t in self.types)
+
+        if mmap:
+            self.positions = self.block('POS')
+            self.data = self.positions.view(POSDTYPE).reshape(-1)
+
+    @property
+    def velocities(self):
+        """Velocities of the selected particles, float32 (N, 3)"""
+
+        return self._lazyblock('VEL')
+
+    @property
+    def ids(self):
+        """Ids of the selected particles"""
+
+        return self._lazyblock('ID')
+
+    @property
+    def masses(self):
+        """Masses of the selected particles, from the MASS block or the mass
+        table. With mmap, a view of the MASS block (or of a single mass)
+        unless the selected types mix both sources"""
+
+        if 'masses' not in self._lazyblocks and self.mmap:
+            tabulated = set(part['headers']['particles'][ptype][1]
+                            for part in self._parts for ptype in self.types
+                            if part['headers']['particles'][ptype][0] > 0)
+
+            if tabulated == set([0]):
+                self._lazyblocks['masses'] = self.block('MASS')
+            elif len(tabulated) == 1:
+                self._lazyblocks['masses'] = np.broadcast_to(
+                    np.float32(tabulated.pop()), (self.nselected,))
+
+        if 'masses' not in self._lazyblocks:
+            masses = np.empty(self.nselected, dtype=np.float32)
+            fromblock = self.block('MASS')
+            filled, used = 0, 0
+
+            # Blocks are concatenated file by file, then type by type
+            for part in self._parts:
+                for ptype in self.types:
+                    npart, mass = part['headers']['particles'][ptype]
+                    if mass == 0 and npart > 0:
+                        masses[filled:filled + npart] = \
+                            fromblock[used:used + npart]
+                        used += npart
+                    else:
+                        masses[filled:filled + npart] = mass
+                    filled += npart
+
+            self._lazyblocks['masses'] = masses
+
+        return self._lazyblocks['masses']
+
+    def _lazyblock(self, name):
+        """Reading a block the first time it is needed"""
+
+        if name not in self._lazyblocks:
+            self._lazyblocks[name] = self.block(name)
+
+        return self._lazyblocks[name]
+
+    def sortbyid(self, cache=False):
+        """Indexing particles by id (Gadget.idindex), from the ID block
+
+        Parameters
+        ----------
+        cache : bool or CatalogCache, optional
+            Memory-map the index from a binary cache (a CatalogCache or the
+            default one if True), building and storing it on a cache miss
+
+        Examples
+        --------
+        >>> gadget.sortbyid(cache=True)
+        >>> rows = gadget.idindex.lookup(ids)
+        """
+
+        if cache:
+            cache = CatalogCache() if cache is True else cache
+            key = cache.key(self.paths, {'idindex': self.types})
+
+            array, meta = cache.get(key)
+            if array is not None:
+                self.idindex = IdIndex.fromarray(array, meta)
+                return
+
+        self.idindex = IdIndex(self.ids)
+
+        if cache:
+            array, meta = self.idindex.toarray()
+            cache.put(key, self.paths, array, meta)
+
+    def rowsforids(self, ids):
+        """Rows of particles (in the file order of Gadget.block) from their
+        ids, NOTAVLBL for ids not in the snapshot
+
+        Examples
+        --------
+        >>> rows = gadget.rowsforids(haloparticleids)
+        >>> positions = gadget.block('POS')[rows]
+        """
+
+        if self.idindex is None:
+            self.sortbyid()
+
+        return self.idindex.lookup(ids)
 
     def load(self, sorting=False, col='x'):
         """Load gadget snapshot into a numpy array
@@ -39,7 +255,9 @@ class Gadget(object):
         sorting : bool, optional
             Whether sorting the data or not
         col : str, optional
-            Specifying the sorting refrence
+            Specifying the sorting refrence, 'x', 'y', 'z' or 'morton' to
+            order the particles along a Morton curve and build
+            Gadget.spatialindex (a MortonIndex of the periodic box)
 
         Returns
         -------
@@ -48,53 +266,580 @@ class Gadget(object):
         Examples
         --------
         >>> gadget.load()
+        >>> gadget.positions # float32 array of shape (N, 3)
+        >>> gadget.data['x'] # Structured view of the same memory
+        >>> gadget.load(sorting=True, col='morton')
+        >>> ranges = gadget.spatialindex.sphere([50., 50., 50.], 2.0)
+        >>> gadget.positions[rangerows(ranges)]
+        """
+
+        if self.mmap:
+            self.positions = self.block('POS')
+        else:
+            self.positions = self._readdata()
+
+        self.order, self.spatialindex = None, None
+
+        if sorting is True and col == 'morton':
+            boxsize = self.headers['BoxSize']
+            self.spatialindex = MortonIndex(self.positions,
+                                            boxsize if boxsize > 0 else None)
+            self.order = self.spatialindex.order
+            self.positions = self.positions[self.order]
+        elif sorting is True:
+            # A stable sort on a single column instead of np.sort(order=col),
+            # which compares whole records
+            self.order = np.argsort(self.positions[:, 'xyz'.index(col)],
+                                    kind='mergesort')
+            self.positions = self.positions[self.order]
+
+        self.data = self.positions.view(POSDTYPE).reshape(-1)
+
+
+    def block(self, name):
+        """Reading (or memory-mapping) a block of the snapshot
+
+        The ranges of the selected particles in all the files are read
+        concurrently, each one straight into its slice of the output.
+
+        Parameters
+        ----------
+        name : str
+            One of BLOCKNAMES except HEAD
+
+        Returns
+        -------
+        numpy.ndarray or numpy.memmap
+            float32 (N, 3) for POS and VEL, uint32 or uint64 for ID and
+            float32 for MASS (only particles without a mass in the mass
+            table) of the selected types. None if the block doesn't exist
         """
 
-        data = self._readdata()
+        layout, ranges = self._blockranges(name)
+
+        if layout is None:
+            return None
+
+        dtype, ncomps = layout
+
+        if self.mmap and len(ranges) == 1:
+            partpath, offset, count = ranges[0]
+            return np.memmap(partpath, dtype=dtype, mode='r', offset=offset,
+                             shape=_shape(count, ncomps))
 
-        if sorting is True:
-            self.data = np.sort(data, order=col)
+        output = np.empty(_shape(sum(r[2] for r in ranges), ncomps),
+                          dtype=dtype)
+
+        jobs, filled = [], 0
+        for partpath, offset, count in ranges:
+            jobs.append((partpath, offset, output[filled:filled + count]))
+            filled += count
+
+        if len(jobs) > 1 and len(self.paths) > 1:
+            nthreads = self.nthreads or min(len(self.paths), cpu_count())
+            pool = ThreadPool(nthreads)
+            try:
+                pool.map(_readinto, jobs)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            self.data = data
+            for job in jobs:
+                _readinto(job)
+
+        return output
+
+    def iterblock(self, name, chunksize=CHUNKPARTICLES):
+        """Reading a block of the snapshot chunk by chunk
+
+        Parameters
+        ----------
+        name : str
+            One of BLOCKNAMES except HEAD
+        chunksize : int, optional
+            Maximum number of particles of each chunk
 
+        Yields
+        ------
+        start : int
+            Index of the first particle of the chunk in Gadget.block(name)
+        chunk : numpy.ndarray or numpy.memmap
+            A fresh array, or a memory-mapped view in mmap mode, see
+            Gadget.block
+        """
+
+        layout, ranges = self._blockranges(name)
+
+        if layout is None:
+            return
+
+        dtype, ncomps = layout
+        itemsize = np.dtype(dtype).itemsize * ncomps
+        start = 0
 
-    def _readheader(self):
-        """Extracting gadget header
+        for partpath, offset, count in ranges:
+            if self.mmap and count > 0:
+                mapped = np.memmap(partpath, dtype=dtype, mode='r',
+                                   offset=offset, shape=_shape(count, ncomps))
+                for begin in range(0, count, chunksize):
+                    chunk = mapped[begin:begin + chunksize]
+                    yield start, chunk
+                    start += len(chunk)
+                continue
+
+            for begin in range(0, count, chunksize):
+                chunk = np.empty(_shape(min(chunksize, count - begin),
+                                        ncomps), dtype=dtype)
+                _readinto((partpath, offset + begin * itemsize, chunk))
+                yield start, chunk
+                start += len(chunk)
+
+    def extract(self, boxes, periodic=True, chunksize=CHUNKPARTICLES):
+        """Extracting the particles inside boxes, streaming the positions
+        chunk by chunk instead of loading the whole snapshot
+
+        Parameters
+        ----------
+        boxes : array of float
+            (lower, upper) corners of each box, shape (nboxes, 2, 3). A box
+            includes lower and excludes upper
+        periodic : bool, optional
+            Wrap the boxes around the periodic box of size BoxSize, e.g.
+            lower=[-5, 0, 0] selects x >= BoxSize - 5 and x < upper[0]
+        chunksize : int, optional
+            Number of particles read at once, the memory used is bounded
+            by the chunk and the extracted particles
 
         Returns
         -------
-        dict
+        indices : numpy.ndarray of int
+            Index of the extracted particles in the file (in the particles
+            of the selected types, as Gadget.positions and velocities)
+        positions : numpy.ndarray
+            float32 (n, 3) positions of the extracted particles
+
+        Examples
+        --------
+        >>> center = np.array([500., 500., 500.])
+        >>> indices, positions = gadget.extract([(center - 5, center + 5)])
+        >>> velocities = gadget.velocities[indices]
         """
-        headerlen = struct.unpack('i', self._file.read(4))[0] + 4
-        fmtstring = "6i8d9i{0:d}x".format(headerlen - 124)
-        headers = struct.unpack(fmtstring, self._file.read(headerlen))
-        return {
-            'particles': {
-                'gas': (headers[0], headers[6]),
-                'halo': (headers[1], headers[7]),
-                'disk': (headers[2], headers[8]),
-                'bulge': (headers[3], headers[9]),
-                'stars': (headers[4], headers[10]),
-                'bndry': (headers[5], headers[11])
-            },
-            'time': headers[12],
-            'nparticles': sum(headers[:6])
-        }
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 2, 3)
+        boxsize = self.headers['BoxSize']
+
+        if periodic and boxsize <= 0:
+            raise ValueError('Periodic boxes need a positive BoxSize')
+
+        indices, positions = [], []
+
+        for start, chunk in self.iterblock('POS', chunksize):
+            inside = np.zeros(len(chunk), dtype=bool)
+
+            for lower, upper in boxes:
+                delta = chunk - lower
+                if periodic:
+                    delta %= boxsize
+                inside |= np.all((delta >= 0) & (delta < upper - lower),
+                                 axis=1)
+
+            selected = np.flatnonzero(inside)
+            indices.append(selected + start)
+            positions.append(chunk[selected])
+
+        if len(indices) == 0:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros((0, 3), dtype=np.float32))
+
+        return np.concatenate(indices), np.concatenate(positions)
+
+    def sample(self, fraction, seed=0, chunksize=CHUNKPARTICLES):
+        """Reading a random sample of the particles
+
+        A particle is selected if a seeded hash of its index is below
+        fraction, so the sample is reproducible and doesn't depend on the
+        chunk size. The selected indices are found first (without reading
+        the file), then only their positions are gathered from a memory map
+        of each file range. The system reads whole pages, so small samples
+        read about one page per particle and samples denser than a few
+        particles per page read most of the block.
+
+        Parameters
+        ----------
+        fraction : float
+            Expected fraction of the particles in the sample, in [0, 1]
+        seed : int, optional
+        chunksize : int, optional
+            Number of particle indices hashed at once
+
+        Returns
+        -------
+        indices : numpy.ndarray of int
+            Index of the sampled particles in the file (in the particles of
+            the selected types), sorted
+        positions : numpy.ndarray
+            float32 (n, 3) positions of the sampled particles
+
+        Examples
+        --------
+        >>> indices, positions = gadget.sample(0.01, seed=42)
+        >>> velocities = gadget.velocities[indices]
+        """
+
+        layout, ranges = self._blockranges('POS')
+        total = sum(r[2] for r in ranges)
+
+        indices = [np.zeros(0, dtype=np.int64)]
+        for begin in range(0, total, chunksize):
+            rows = np.arange(begin, min(begin + chunksize, total),
+                             dtype=np.uint64)
+            selected = np.flatnonzero(_hashuniform(rows, seed) < fraction)
+            indices.append(selected.astype(np.int64) + begin)
+
+        indices = np.concatenate(indices)
+        positions = np.empty((len(indices), 3), dtype=np.float32)
+
+        if layout is None:
+            return indices, positions
+
+        dtype, ncomps = layout
+        start = 0
+
+        for partpath, offset, count in ranges:
+            first, last = np.searchsorted(indices, [start, start + count])
+
+            if last > first:
+                mapped = np.memmap(partpath, dtype=dtype, mode='r',
+                                   offset=offset, shape=_shape(count, ncomps))
+                positions[first:last] = mapped[indices[first:last] - start]
+                del mapped
+
+            start += count
+
+        return indices, positions
+
+    def _blockranges(self, name):
+        """Type, number of components and (path, offset, count) ranges of the
+        selected particles of a block in all the files"""
+
+        layout = None
+        ranges = []
+
+        for part in self._parts:
+            if name not in part['blocks']:
+                continue
+
+            offset, nbytes = part['blocks'][name]
+            counts = _blockcounts(name, part['headers']['particles'])
+
+            partlayout = _blocklayout(name, nbytes, sum(counts))
+            itemsize = np.dtype(partlayout[0]).itemsize * partlayout[1]
+
+            if nbytes != itemsize * sum(counts):
+                raise IOError('%s block of %s holds %d bytes, expected %d'
+                              % (name, part['path'], nbytes,
+                                 itemsize * sum(counts)))
+
+            if layout is not None and partlayout != layout:
+                raise IOError('%s block of %s has a different type'
+                              % (name, part['path']))
+            layout = partlayout
+
+            ranges += [(part['path'], offset + begin * itemsize, end - begin)
+                       for begin, end in _selectedranges(counts, self.types)]
+
+        return layout, ranges
 
     def _readdata(self):
         """Extracting position data
 
         Returns
         -------
-        numpy.ndaaray
+        numpy.ndarray
+            float32 array of shape (N, 3)
         """
 
-        positionslen = struct.unpack('i', self._file.read(4))[0] + 4
-        fmtstring = "{0:d}f4x".format(self.headers['nparticles']*3)
-        positions = struct.unpack(fmtstring, self._file.read(positionslen))
+        return self.block('POS')
+
+
+def _snapshotpaths(path):
+    """Files of a (possibly multi-file) snapshot
+
+    Parameters
+    ----------
+    path : str
+        A single file snapshot, the base name of a multi-file snapshot
+        (without the .N suffix) or any of its files
+
+    Returns
+    -------
+    list of str
+    """
+
+    first = path
+    if not os.path.exists(path) and os.path.exists(path + '.0'):
+        first = path + '.0'
+
+    with open(first, 'rb') as _file:
+        numfiles = _readheader(_file)['NumFiles']
+
+    if numfiles <= 1:
+        return [first]
+
+    base = re.sub(r'\.\d+$', '', first)
+    paths = ['%s.%d' % (base, i) for i in range(numfiles)]
+
+    for partpath in paths:
+        if not os.path.exists(partpath):
+            raise IOError('Missing file of a %d files snapshot: %s'
+                          % (numfiles, partpath))
+
+    return paths
+
+
+def _readheader(_file):
+    """Extracting gadget header, from a format 1 or 2 file
+
+    Returns
+    -------
+    dict
+    """
+
+    head = np.fromfile(_file, dtype=np.int32, count=1)
+    if len(head) == 1 and head[0] == LABELBYTES:
+        _file.seek(LABELBYTES + 4, os.SEEK_CUR)
+    else:
+        _file.seek(-len(head) * 4, os.SEEK_CUR)
+
+    record = _readrecord(_file, np.uint8).tobytes()
+    headers = struct.unpack(HEADERFORMAT,
+                            record[:struct.calcsize(HEADERFORMAT)])
+
+    return {
+        'particles': dict(
+            (ptype, (headers[i], headers[6 + i]))
+            for i, ptype in enumerate(PTYPES)),
+        'time': headers[12],
+        'redshift': headers[13],
+        'nparticles': sum(headers[:6]),
+        'npartTotal': [headers[16 + i] + (headers[30 + i] << 32)
+                       for i in range(6)],
+        'NumFiles': headers[23],
+        'BoxSize': headers[24],
+        'Omega0': headers[25],
+        'OmegaLambda': headers[26],
+        'HubbleParam': headers[27]
+    }
+
+
+def _mergeheaders(parts):
+    """Header of a snapshot from the headers of its files, counting the
+    particles of all the files"""
+
+    headers = dict(parts[0])
+
+    headers['particles'] = dict(
+        (ptype, (sum(p['particles'][ptype][0] for p in parts),
+                 parts[0]['particles'][ptype][1]))
+        for ptype in PTYPES)
+    headers['nparticles'] = sum(p['nparticles'] for p in parts)
+
+    # npartTotal is left to zero by some writers of single file snapshots
+    if sum(headers['npartTotal']) not in (0, headers['nparticles']):
+        raise IOError('The files hold %d particles, npartTotal is %d'
+                      % (headers['nparticles'], sum(headers['npartTotal'])))
+
+    return headers
+
+
+def _blocknames(particles):
+    """Names of the blocks expected in a file with these particles"""
+
+    withmass = [n for n, m in particles.values() if n > 0 and m == 0]
+
+    return BLOCKNAMES if withmass else BLOCKNAMES[:-1]
+
+
+def _blockcounts(name, particles):
+    """Number of particles of each type (PTYPES) in a block"""
+
+    if name == 'MASS':
+        return [n if m == 0 else 0 for n, m in
+                (particles[t] for t in PTYPES)]
+
+    return [particles[t][0] for t in PTYPES]
+
+
+def _readinto(job):
+    """Reading a range of a file into (a slice of) an array"""
+
+    path, offset, output = job
+
+    with open(path, 'rb') as _file:
+        _file.seek(offset)
+        nbytes = _file.readinto(output)
+
+    if nbytes != output.nbytes:
+        raise IOError('Unexpected end of file: ' + path)
+
+
+def _hashuniform(values, seed):
+    """Uniform floats in [0, 1) from a seeded hash (splitmix64) of uint64
+    values"""
+
+    golden = np.uint64(0x9e3779b97f4a7c15)
+    seed = np.uint64((seed * 0x9e3779b97f4a7c15 + 0x632be59bd9b4e019)
+                     % 2**64)
+
+    with np.errstate(over='ignore'):
+        values = values * golden + seed
+        values = (values ^ (values >> np.uint64(30))) \
+                 * np.uint64(0xbf58476d1ce4e5b9)
+        values = (values ^ (values >> np.uint64(27))) \
+                 * np.uint64(0x94d049bb133111eb)
+        values ^= values >> np.uint64(31)
+
+    return (values >> np.uint64(11)) * (1.0 / 2**53)
+
+
+def _shape(count, ncomps):
+    """Shape of count elements of ncomps components"""
+
+    return (count, ncomps) if ncomps > 1 else (count,)
+
+
+def _snapformat(path):
+    """SnapFormat of a file, 2 if its first record is an 8 bytes block label
+    and 1 otherwise"""
+
+    with open(path, 'rb') as _file:
+        head = np.fromfile(_file, dtype=np.int32, count=1)
+
+    return 2 if len(head) == 1 and head[0] == LABELBYTES else 1
+
+
+def _blockdirectory(path, names, snapformat=1):
+    """Finding the offsets of the blocks of a snapshot by following their
+    record markers, in a single pass over the file
+
+    Parameters
+    ----------
+    path : str
+    names : list of str
+        Names of the blocks, in the order of the file. Only used by format 1
+        files, format 2 files label their blocks
+    snapformat : int, optional
+        SnapFormat of the file, 1 or 2
+
+    Returns
+    -------
+    dict
+        (offset, nbytes) of each block present in the file
+    """
+
+    size = os.path.getsize(path)
+    blocks = {}
+    offset = 0
+
+    with open(path, 'rb') as _file:
+        while offset + 4 <= size:
+            if snapformat == 1 and len(blocks) == len(names):
+                break
+
+            if snapformat == 2:
+                _file.seek(offset)
+                label = _readrecord(_file, np.uint8).tobytes()
+                if len(label) != LABELBYTES:
+                    raise IOError('Corrupted block label at byte %d of %s'
+                                  % (offset, path))
+                name = label[:4].decode('ascii').strip()
+                offset += LABELBYTES + 8
+            else:
+                name = names[len(blocks)]
+
+            _file.seek(offset)
+            nbytes = int(np.fromfile(_file, dtype=np.int32, count=1)[0])
+
+            _file.seek(offset + 4 + nbytes)
+            tail = np.fromfile(_file, dtype=np.int32, count=1)
+            if len(tail) != 1 or tail[0] != nbytes:
+                raise IOError('Corrupted %s block at byte %d of %s'
+                              % (name, offset, path))
+
+            blocks[name] = (offset + 4, nbytes)
+            offset += nbytes + 8
+
+    return blocks
+
+
+def _blocklayout(name, nbytes, nparticles):
+    """Type and number of components of the elements of a block"""
+
+    if name in ('POS', 'VEL'):
+        return np.float32, 3
+
+    if name == 'ID':
+        return (np.uint64 if nbytes == 8 * nparticles else np.uint32), 1
+
+    return np.float32, 1
+
+
+def _selectedranges(counts, types):
+    """Ranges of particle indices of the selected types in a block, merging
+    the adjacent ones
+
+    Parameters
+    ----------
+    counts : list of int
+        Number of particles of each type (PTYPES) in the block
+    types : list of str
+        Selected types
+
+    Returns
+    -------
+    list of (int, int)
+        (begin, end) particle indices
+    """
+
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    ranges = []
+
+    for i, ptype in enumerate(PTYPES):
+        if ptype not in types or counts[i] == 0:
+            continue
+
+        if ranges and ranges[-1][1] == offsets[i]:
+            ranges[-1] = (ranges[-1][0], offsets[i + 1])
+        else:
+            ranges.append((offsets[i], offsets[i + 1]))
+
+    return ranges
+
+
+def _readrecord(_file, dtype):
+    """Reading a Fortran unformatted record, checking its size markers
+
+    Parameters
+    ----------
+    _file : file
+    dtype : numpy.dtype
+        Type of the elements of the record
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    head = np.fromfile(_file, dtype=np.int32, count=1)
+    if len(head) != 1:
+        raise IOError('Unexpected end of file')
+
+    nbytes = int(head[0])
+    data = np.fromfile(_file, dtype=dtype,
+                       count=nbytes // np.dtype(dtype).itemsize)
+    tail = np.fromfile(_file, dtype=np.int32, count=1)
 
-        tmp = [(0.0, 0.0, 0.0)] * self.headers['nparticles']
-        for i in range(self.headers['nparticles']):
-            tmp[i] = (positions[i*3], positions[i*3 + 1], positions[i*3 + 2])
+    if data.nbytes != nbytes or len(tail) != 1 or tail[0] != nbytes:
+        raise IOError('Corrupted record of %d bytes' % nbytes)
 
-        return np.array(tmp, dtype=self.dtype)
+    return data
@@ -0,0 +1,237 @@
+"""gadgetwriter.py
+Writing Gadget 2 snapshots (SnapFormat 1 or 2, single or multi-file) chunk
+by chunk, without holding the particles in memory
+"""
+
+import struct
+
+import numpy as np
+
+from .gadget import HEADERFORMAT, LABELBYTES, PTYPES
+
+
+class GadgetWriter(object):
+    """Streaming writer of Gadget snapshots
+
+    The size of every block is known from the particle counts, so all the
+    records are laid out when the files are created and each chunk is
+    written straight at its offset. Particles of each type are split evenly
+    between the files.
+
+    Parameters
+    ----------
+    path : str
+        Path of the snapshot, files are path.0, path.1, ... if numfiles > 1
+    npart : dict
+        Total number of particles of each type, e.g. {'halo': 512**3}
+    massarr : dict, optional
+        Mass of the particles of each type, types without (or with a zero)
+        mass get a MASS block and their masses are given to write
+    boxsize : float, optional
+    time, redshift : float, optional
+    numfiles : int, optional
+    snapformat : int, optional
+        1 or 2 (with a label record before each block)
+    idtype : numpy.dtype, optional
+        np.uint32 or np.uint64
+    cosmology : dict, optional
+        Omega0, OmegaLambda and HubbleParam of the header
+
+    Examples
+    --------
+    >>> from mytools.simulation.gadgetwriter import GadgetWriter
+    >>> with GadgetWriter('/path/to/snapshot', {'halo': n},
+    ...                   {'halo': 1e-3}, boxsize=100.0) as writer:
+    ...     for positions, velocities, ids in chunks:
+    ...         writer.write('halo', positions, velocities, ids)
+    """
+
+    def __init__(self, path, npart, massarr=None, boxsize=0.0, time=1.0,
+                 redshift=0.0, numfiles=1, snapformat=1, idtype=np.uint32,
+                 cosmology=None):
+        """Constructor for GadgetWriter class"""
+
+        if snapformat not in (1, 2):
+            raise ValueError('SnapFormat must be 1 or 2')
+
+        massarr = {} if massarr is None else massarr
+        cosmology = {} if cosmology is None else cosmology
+
+        self.npart = [int(npart.get(t, 0)) for t in PTYPES]
+        self.massarr = [float(massarr.get(t, 0.0)) for t in PTYPES]
+        self.idtype = np.dtype(idtype)
+        self.snapformat = snapformat
+        self.numfiles = numfiles
+        self.paths = [path] if numfiles == 1 else \
+                     ['%s.%d' % (path, i) for i in range(numfiles)]
+
+        # Particles of each type in each file, shape (numfiles, 6)
+        self.fileparts = np.array(
+            [[n // numfiles + (1 if i < n % numfiles else 0) for n in
+              self.npart] for i in range(numfiles)], dtype=np.int64)
+
+        self.written = [0] * len(PTYPES)
+        self._blocks = []
+        self._files = []
+
+        for i, filepath in enumerate(self.paths):
+            header = _packheader(self.fileparts[i], self.massarr, self.npart,
+                                 time, redshift, numfiles, boxsize,
+                                 cosmology)
+            self._files.append(open(filepath, 'w+b'))
+            self._blocks.append(self._layout(self._files[-1], header,
+                                             self.fileparts[i]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, value, traceback):
+        if exctype is None:
+            self.close()
+        else:
+            for _file in self._files:
+                _file.close()
+
+    def write(self, ptype, positions, velocities=None, ids=None,
+              masses=None):
+        """Writing the next chunk of particles of a type
+
+        Parameters
+        ----------
+        ptype : str
+            One of PTYPES
+        positions : numpy.ndarray
+            Shape (n, 3)
+        velocities : numpy.ndarray, optional
+            Shape (n, 3), zero by default
+        ids : numpy.ndarray of int, optional
+            Consecutive ids (from the particles already written) by default
+        masses : numpy.ndarray of float, optional
+            Only for the types without a mass in massarr
+        """
+
+        t = PTYPES.index(ptype)
+        count = len(positions)
+
+        if self.written[t] + count > self.npart[t]:
+            raise ValueError('More than %d %s particles'
+                             % (self.npart[t], ptype))
+
+        if velocities is None:
+            velocities = np.zeros((count, 3), dtype=np.float32)
+
+        if ids is None:
+            ids = np.arange(self.written[t], self.written[t] + count) \
+                  + sum(self.npart[:t])
+
+        if self.massarr[t] == 0 and masses is None:
+            raise ValueError('Masses of %s particles are not in massarr'
+                             % ptype)
+
+        values = {
+            'POS': np.ascontiguousarray(positions, dtype=np.float32),
+            'VEL': np.ascontiguousarray(velocities, dtype=np.float32),
+            'ID': np.ascontiguousarray(ids, dtype=self.idtype),
+            'MASS': None if self.massarr[t] != 0 else
+                    np.ascontiguousarray(masses, dtype=np.float32)}
+
+        # Splitting the chunk between the files
+        done = 0
+        while done < count:
+            index = self.written[t] + done
+            ends = np.cumsum(self.fileparts[:, t])
+            i = int(np.searchsorted(ends, index, side='right'))
+            local = index - (ends[i] - self.fileparts[i, t])
+            size = int(min(count - done, ends[i] - index))
+
+            for name, array in values.items():
+                if array is None:
+                    continue
+                offset = self._blocks[i][name]
+                itemsize = array.nbytes // count
+                first = sum(self.fileparts[i, :t]) if name != 'MASS' else \
+                        sum(n for n, m in zip(self.fileparts[i, :t],
+                                              self.massarr[:t]) if m == 0)
+                self._files[i].seek(offset + (first + local) * itemsize)
+                self._files[i].write(array[done:done + size].tobytes())
+
+            done += size
+
+        self.written[t] += count
+
+    def close(self):
+        """Closing the files, checking that all the particles were written"""
+
+        for _file in self._files:
+            _file.close()
+
+        missing = [(t, n - w) for t, n, w in
+                   zip(PTYPES, self.npart, self.written) if w != n]
+        if missing:
+            raise ValueError('Particles not written: %s' % missing)
+
+    def _layout(self, _file, header, fileparts):
+        """Writing the header and the record markers of a file
+
+        Returns
+        -------
+        dict
+            Offset of the data of each block
+        """
+
+        withmass = sum(n for n, m in zip(fileparts, self.massarr) if m == 0)
+        nparticles = int(np.sum(fileparts))
+
+        records = [('HEAD', len(header)),
+                   ('POS', 12 * nparticles),
+                   ('VEL', 12 * nparticles),
+                   ('ID', self.idtype.itemsize * nparticles)]
+        if withmass > 0:
+            records.append(('MASS', 4 * withmass))
+
+        blocks = {}
+        offset = 0
+
+        for name, nbytes in records:
+            if nbytes >= 2**31:
+                raise ValueError('The %s block of %d bytes overflows its '
+                                 'record markers, use more files'
+                                 % (name, nbytes))
+
+            if self.snapformat == 2:
+                label = struct.pack('i4sii', LABELBYTES,
+                                    name.ljust(4).encode('ascii'),
+                                    nbytes + 8, LABELBYTES)
+                _file.seek(offset)
+                _file.write(label)
+                offset += len(label)
+
+            _file.seek(offset)
+            _file.write(struct.pack('i', nbytes))
+            _file.seek(offset + 4 + nbytes)
+            _file.write(struct.pack('i', nbytes))
+
+            blocks[name] = offset + 4
+            offset += nbytes + 8
+
+        _file.seek(blocks['HEAD'])
+        _file.write(header)
+
+        return blocks
+
+
+def _packheader(fileparts, massarr, npart, time, redshift, numfiles,
+                boxsize, cosmology):
+    """Packing a 256 bytes header"""
+
+    header = struct.pack(
+        HEADERFORMAT,
+        *([int(n) for n in fileparts] + list(massarr) +
+          [time, redshift, 0, 0] +
+          [n % 2**32 for n in npart] +
+          [0, numfiles, boxsize,
+           cosmology.get('Omega0', 0.0), cosmology.get('OmegaLambda', 0.0),
+           cosmology.get('HubbleParam', 0.0), 0, 0] +
+          [n // 2**32 for n in npart]))
+
+    return header + b'\0' * (256 - len(header))
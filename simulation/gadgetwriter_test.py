@@ -0,0 +1,148 @@
+"""gadgetwriter_test.py
+Checking that snapshots written by GadgetWriter are read back by Gadget
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from .gadget import Gadget
+from .gadgetwriter import GadgetWriter
+from .synthetic import lattice, writesynthetic
+
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gadget',
+                      'z1_2LPT_8_1kpc.dat')
+
+
+def _particles(n, seed):
+    """Positions, velocities, ids and masses of n particles"""
+
+    rng = np.random.RandomState(seed)
+
+    return (rng.random_sample((n, 3)).astype(np.float32),
+            rng.standard_normal((n, 3)).astype(np.float32),
+            rng.permutation(n).astype(np.uint64) + np.uint64(2**40),
+            rng.random_sample(n).astype(np.float32))
+
+
+@pytest.mark.parametrize('snapformat', [1, 2])
+@pytest.mark.parametrize('numfiles', [1, 3])
+def test_roundtrip(tmp_path, snapformat, numfiles):
+    path = str(tmp_path / 'snapshot')
+    npart = {'gas': 10, 'halo': 25, 'stars': 7}
+    massarr = {'halo': 0.5}
+    particles = dict((t, _particles(n, i))
+                     for i, (t, n) in enumerate(sorted(npart.items())))
+
+    with GadgetWriter(path, npart, massarr, boxsize=1.0, time=0.5,
+                      redshift=1.0, numfiles=numfiles,
+                      snapformat=snapformat, idtype=np.uint64) as writer:
+        for ptype in sorted(npart):
+            pos, vel, ids, masses = particles[ptype]
+            # In uneven chunks, crossing the files
+            for begin, end in ((0, 4), (4, 5), (5, npart[ptype])):
+                writer.write(ptype, pos[begin:end], vel[begin:end],
+                             ids[begin:end],
+                             None if ptype in massarr else
+                             masses[begin:end])
+
+    gadget = Gadget(path)
+
+    assert gadget.nselected == 42
+    assert gadget.format == snapformat
+    assert len(gadget.paths) == numfiles
+    assert gadget.headers['BoxSize'] == 1.0
+    assert gadget.headers['particles']['halo'] == (25, 0.5)
+
+    # Particles of each type are split between the files, and the files
+    # are read one after the other
+    for ptype in npart:
+        selected = Gadget(path, types=[ptype])
+        pos, vel, ids, masses = particles[ptype]
+
+        np.testing.assert_array_equal(np.sort(selected.ids), np.sort(ids))
+        rows = np.argsort(ids)[np.searchsorted(np.sort(ids), selected.ids)]
+        np.testing.assert_array_equal(selected.block('POS'), pos[rows])
+        np.testing.assert_array_equal(selected.velocities, vel[rows])
+
+        expected = np.full(len(ids), 0.5, dtype=np.float32) \
+                   if ptype in massarr else masses[rows]
+        np.testing.assert_array_equal(selected.masses, expected)
+
+
+def test_rewrite_sample(tmp_path):
+    gadget = Gadget(SAMPLE)
+    headers = gadget.headers
+    path = str(tmp_path / 'rewritten.dat')
+
+    with GadgetWriter(
+            path, dict((t, n) for t, (n, _) in headers['particles'].items()),
+            dict((t, m) for t, (_, m) in headers['particles'].items()),
+            boxsize=headers['BoxSize'], time=headers['time'],
+            redshift=headers['redshift'], idtype=gadget.ids.dtype,
+            cosmology=dict((k, headers[k]) for k in
+                           ('Omega0', 'OmegaLambda', 'HubbleParam'))) \
+            as writer:
+        writer.write('halo', gadget.block('POS'), gadget.velocities,
+                     gadget.ids)
+
+    with open(SAMPLE, 'rb') as original, open(path, 'rb') as rewritten:
+        assert original.read() == rewritten.read()
+
+
+def test_writesynthetic(tmp_path):
+    path = str(tmp_path / 'lattice')
+
+    writesynthetic(path, lattice(4, 8.0, chunksize=10), 64, 8.0,
+                   numfiles=2, snapformat=2)
+
+    gadget = Gadget(path)
+    np.testing.assert_array_equal(gadget.ids, np.arange(64))
+    np.testing.assert_array_equal(gadget.block('POS')[:, 2],
+                                  np.tile([1.0, 3.0, 5.0, 7.0], 16))
+
+
+def test_counts(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    pos = np.zeros((3, 3))
+
+    with pytest.raises(ValueError):
+        with GadgetWriter(path, {'halo': 2}, {'halo': 1.0}) as writer:
+            writer.write('halo', pos)
+
+    writer = GadgetWriter(path, {'halo': 4}, {'halo': 1.0})
+    writer.write('halo', pos)
+    with pytest.raises(ValueError):
+        writer.close()
+
+    with pytest.raises(ValueError):
+        with GadgetWriter(path, {'gas': 3}) as writer:
+            writer.write('gas', pos)
+
+
+def test_mmap_masses(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    npart = {'gas': 6, 'halo': 5, 'disk': 4}
+    massarr = {'halo': 0.5, 'disk': 0.5}
+    particles = dict((t, _particles(n, i))
+                     for i, (t, n) in enumerate(sorted(npart.items())))
+
+    with GadgetWriter(path, npart, massarr, boxsize=1.0) as writer:
+        for ptype in ('gas', 'halo', 'disk'):
+            pos, vel, ids, masses = particles[ptype]
+            writer.write(ptype, pos, vel, ids,
+                         None if ptype in massarr else masses)
+
+    gas = Gadget(path, mmap=True, types=['gas'])
+    assert isinstance(gas.masses, np.memmap)
+    np.testing.assert_array_equal(gas.masses, particles['gas'][3])
+
+    tabulated = Gadget(path, mmap=True, types=['halo', 'disk'])
+    assert tabulated.masses.strides == (0,)
+    np.testing.assert_array_equal(tabulated.masses, np.full(9, 0.5))
+
+    mixed = Gadget(path, mmap=True)
+    np.testing.assert_array_equal(mixed.masses, Gadget(path).masses)
+    np.testing.assert_array_equal(mixed.masses[:6], particles['gas'][3])
@@ -0,0 +1,231 @@
+"""mortonindex.py
+Ordering particles along a Morton (Z-order) curve, so that the particles of
+a box or a sphere are a few contiguous ranges of the ordered array
+"""
+
+import numpy as np
+
+
+# Maximum number of levels (bits per axis) of the cell grid, 2**(3 * 8)
+# cells and an offset table of 128MB
+MAXLEVEL = 8
+
+# Number of particles whose keys are computed at once, bounding the float64
+# and uint64 temporaries
+CHUNKPOINTS = 1024**2
+
+
+class MortonIndex(object):
+    """Morton ordering of particles on a grid of 2**level cells per axis
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+        Positions of the particles, shape (n, 3)
+    boxsize : float, optional
+        Size of the periodic box, in the same units as positions. None for
+        the (non-periodic) bounding cube of the particles
+    level : int, optional
+        Number of bits per axis of the cell keys, default is about 16
+        particles per cell (at most MAXLEVEL)
+
+    Attributes
+    ----------
+    self.order : numpy.ndarray of int
+        Permutation of the particles, positions[order] is sorted by key
+    self.offsets : numpy.ndarray of int
+        Particles of the cell of key k are order[offsets[k]:offsets[k+1]]
+
+    Examples
+    --------
+    >>> from mytools.simulation.mortonindex import MortonIndex, rangerows
+    >>> index = MortonIndex(positions, boxsize=1000.0)
+    >>> ordered = positions[index.order]
+    >>> ranges = index.sphere([500., 500., 500.], 20.0)
+    >>> candidates = ordered[rangerows(ranges)]
+    """
+
+    def __init__(self, positions, boxsize=None, level=None):
+        """Constructor for MortonIndex class"""
+
+        positions = np.asarray(positions)
+        self.npoints = len(positions)
+        self.periodic = boxsize is not None
+
+        if self.periodic:
+            self.origin = np.zeros(3)
+            self.size = float(boxsize)
+        elif self.npoints > 0:
+            self.origin = positions.min(axis=0).astype(np.float64)
+            self.size = float(np.max(positions.max(axis=0) - self.origin))
+            self.size = self.size if self.size > 0 else 1.0
+        else:
+            self.origin, self.size = np.zeros(3), 1.0
+
+        if level is None:
+            level = int(np.log2(max(self.npoints, 1) / 16.0) / 3 + 0.5)
+        self.level = min(max(level, 1), MAXLEVEL)
+
+        self.ncells = 2**self.level
+        self.cellsize = self.size / self.ncells
+
+        # Keys of 3 * level bits, computed chunk by chunk
+        keys = np.empty(self.npoints,
+                        dtype=np.int32 if self.level <= 10 else np.int64)
+        for begin in range(0, self.npoints, CHUNKPOINTS):
+            keys[begin:begin + CHUNKPOINTS] = \
+                self.keys(positions[begin:begin + CHUNKPOINTS])
+
+        self.order = np.argsort(keys, kind='mergesort')
+        self.offsets = np.zeros(self.ncells**3 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.ncells**3),
+                  out=self.offsets[1:])
+
+    def keys(self, positions):
+        """Morton keys of the cells of positions"""
+
+        return mortonkeys(self._cells(positions), self.level)
+
+    def box(self, lower, upper):
+        """Ranges of the ordered particles in the cells overlapping a box
+
+        Parameters
+        ----------
+        lower, upper : array of float
+            Corners of the box. For a periodic index the box may cross the
+            boundaries, e.g. lower=[-5, 0, 0]
+
+        Returns
+        -------
+        numpy.ndarray of int
+            (begin, end) rows of positions[order], shape (nranges, 2)
+        """
+
+        return self._ranges(self._boxcells(lower, upper))
+
+    def sphere(self, center, radius):
+        """Ranges of the ordered particles in the cells overlapping a sphere,
+        see MortonIndex.box"""
+
+        center = np.asarray(center, dtype=np.float64)
+        cells = self._boxcells(center - radius, center + radius)
+
+        # Distance of the center to the nearest point of each cell
+        delta = (cells + 0.5) * self.cellsize + self.origin - center
+        if self.periodic:
+            delta = (delta + self.size / 2.0) % self.size - self.size / 2.0
+        gap = np.maximum(np.abs(delta) - self.cellsize / 2.0, 0.0)
+
+        return self._ranges(cells[np.sum(gap**2, axis=1) <= radius**2])
+
+    def _cells(self, positions):
+        """Integer cell coordinates of positions, shape (n, 3)"""
+
+        cells = np.floor((np.asarray(positions, dtype=np.float64)
+                          - self.origin) / self.cellsize).astype(np.int64)
+
+        if self.periodic:
+            return cells % self.ncells
+
+        return np.clip(cells, 0, self.ncells - 1)
+
+    def _boxcells(self, lower, upper):
+        """Coordinates of the cells overlapping a box, shape (n, 3)"""
+
+        lower = np.floor((np.asarray(lower, dtype=np.float64) - self.origin)
+                         / self.cellsize).astype(np.int64)
+        upper = np.floor((np.asarray(upper, dtype=np.float64) - self.origin)
+                         / self.cellsize).astype(np.int64)
+
+        axes = []
+        for low, high in zip(lower, upper):
+            if self.periodic:
+                if high - low + 1 >= self.ncells:
+                    axes.append(np.arange(self.ncells))
+                else:
+                    axes.append(np.arange(low, high + 1) % self.ncells)
+            else:
+                axes.append(np.arange(max(low, 0),
+                                      min(high, self.ncells - 1) + 1))
+
+        grid = np.meshgrid(*axes, indexing='ij')
+
+        return np.column_stack([g.ravel() for g in grid])
+
+    def _ranges(self, cells):
+        """Merging the particles of cells into contiguous ranges"""
+
+        keys = np.unique(mortonkeys(cells, self.level))
+
+        begins = self.offsets[keys]
+        ends = self.offsets[keys + 1]
+
+        # Consecutive keys are adjacent in the ordered array, as are cells
+        # separated by empty cells only
+        keep = ends > begins
+        begins, ends = begins[keep], ends[keep]
+
+        if len(begins) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        newrange = np.ones(len(begins), dtype=bool)
+        newrange[1:] = begins[1:] != ends[:-1]
+        starts = np.flatnonzero(newrange)
+        stops = np.append(starts[1:], len(begins)) - 1
+
+        return np.column_stack((begins[starts], ends[stops]))
+
+
+def mortonkeys(cells, level):
+    """Interleaving the bits of integer cell coordinates
+
+    Parameters
+    ----------
+    cells : numpy.ndarray of int
+        Cell coordinates, shape (n, 3), each in [0, 2**level)
+    level : int
+        Number of bits per axis, at most 21
+
+    Returns
+    -------
+    numpy.ndarray of int64
+    """
+
+    cells = np.asarray(cells, dtype=np.uint64).reshape(-1, 3)
+
+    keys = (_spread(cells[:, 0]) << np.uint64(2)) \
+           | (_spread(cells[:, 1]) << np.uint64(1)) \
+           | _spread(cells[:, 2])
+
+    return keys.astype(np.int64)
+
+
+def rangerows(ranges):
+    """Rows of the (begin, end) ranges of MortonIndex.box and sphere"""
+
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+
+    if len(ranges) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # The aranges of all the ranges, as one cumulative sum of steps
+    lengths = ranges[:, 1] - ranges[:, 0]
+    steps = np.ones(np.sum(lengths), dtype=np.int64)
+    steps[0] = ranges[0, 0]
+    steps[np.cumsum(lengths)[:-1]] = ranges[1:, 0] - ranges[:-1, 1] + 1
+
+    return np.cumsum(steps)
+
+
+def _spread(values):
+    """Inserting two zero bits between the bits of 21 bits integers"""
+
+    values = values & np.uint64(0x1fffff)
+
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+                        (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+                        (2, 0x1249249249249249)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+
+    return values
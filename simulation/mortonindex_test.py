@@ -0,0 +1,118 @@
+"""mortonindex_test.py
+Checking the box and sphere queries of MortonIndex against brute force
+"""
+
+import numpy as np
+import pytest
+
+from . import mortonindex
+from .mortonindex import MortonIndex, mortonkeys, rangerows
+
+
+BOXSIZE = 10.0
+
+
+def _candidates(index, positions, ranges):
+    """Rows (in positions) of the particles of the ranges"""
+
+    rows = index.order[rangerows(ranges)]
+    assert len(np.unique(rows)) == len(rows)
+
+    return rows
+
+
+def _separation(positions, center, periodic):
+    """Per axis separation to a point, nearest image if periodic"""
+
+    delta = positions - center
+    if periodic:
+        delta = (delta + BOXSIZE / 2.0) % BOXSIZE - BOXSIZE / 2.0
+
+    return delta
+
+
+@pytest.fixture
+def positions():
+    rng = np.random.RandomState(0)
+    return (rng.random_sample((20000, 3)) * BOXSIZE).astype(np.float32)
+
+
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('lower, upper', [
+    ([1.0, 2.0, 3.0], [2.5, 4.0, 3.5]),
+    ([-1.0, 9.0, 4.0], [1.0, 11.0, 6.0]),
+    ([-20.0, 0.0, 0.0], [20.0, 0.5, 0.5]),
+    ([12.0, 12.0, 12.0], [13.0, 13.0, 13.0]),
+])
+def test_box(positions, periodic, lower, upper):
+    index = MortonIndex(positions, boxsize=BOXSIZE if periodic else None)
+    lower, upper = np.array(lower), np.array(upper)
+
+    if periodic:
+        inside = np.all((positions - lower) % BOXSIZE <= upper - lower,
+                        axis=1) | np.all(upper - lower >= BOXSIZE)
+    else:
+        inside = np.all((positions >= lower) & (positions <= upper), axis=1)
+
+    rows = _candidates(index, positions, index.box(lower, upper))
+    center, half = (lower + upper) / 2.0, (upper - lower) / 2.0
+
+    assert set(np.flatnonzero(inside)) <= set(rows)
+    separation = np.abs(_separation(positions[rows], center, periodic))
+    assert np.all(separation <= half + index.cellsize)
+
+
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('center, radius', [
+    ([5.0, 5.0, 5.0], 1.0),
+    ([0.2, 9.9, 5.0], 0.7),
+    ([3.0, 3.0, 3.0], 0.0),
+    ([5.0, 5.0, 5.0], 20.0),
+])
+def test_sphere(positions, periodic, center, radius):
+    index = MortonIndex(positions, boxsize=BOXSIZE if periodic else None)
+    center = np.array(center)
+
+    distance = np.sqrt(np.sum(
+        _separation(positions, center, periodic)**2, axis=1))
+
+    rows = _candidates(index, positions, index.sphere(center, radius))
+
+    assert set(np.flatnonzero(distance <= radius)) <= set(rows)
+    assert np.all(distance[rows] <= radius + np.sqrt(3) * index.cellsize)
+
+
+def test_order(positions):
+    index = MortonIndex(positions, boxsize=BOXSIZE, level=3)
+    keys = index.keys(positions)
+
+    assert np.all(np.diff(keys[index.order]) >= 0)
+    np.testing.assert_array_equal(
+        np.diff(index.offsets), np.bincount(keys, minlength=8**3))
+
+
+def test_chunks(positions, monkeypatch):
+    index = MortonIndex(positions, boxsize=BOXSIZE)
+    monkeypatch.setattr(mortonindex, 'CHUNKPOINTS', 999)
+    chunked = MortonIndex(positions, boxsize=BOXSIZE)
+
+    np.testing.assert_array_equal(chunked.order, index.order)
+    np.testing.assert_array_equal(chunked.order,
+                                  np.argsort(index.keys(positions),
+                                             kind='mergesort'))
+
+
+def test_mortonkeys():
+    cells = np.array([[0, 0, 0], [0, 0, 1], [0, 1, 0], [1, 0, 0],
+                      [1, 1, 1], [2, 0, 0], [3, 3, 3]])
+
+    np.testing.assert_array_equal(mortonkeys(cells, 2),
+                                  [0, 1, 2, 4, 7, 32, 63])
+
+
+def test_rangerows():
+    ranges = [[2, 5], [5, 5], [7, 8], [10, 13]]
+
+    np.testing.assert_array_equal(rangerows(ranges),
+                                  [2, 3, 4, 7, 10, 11, 12])
+    assert len(rangerows(np.zeros((0, 2)))) == 0
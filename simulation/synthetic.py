@@ -0,0 +1,175 @@
+"""synthetic.py
+Generating synthetic particle distributions chunk by chunk (uniform, lattice
+and NFW halos) and writing them as Gadget snapshots, e.g. for benchmarks
+"""
+
+import numpy as np
+
+from .gadgetwriter import GadgetWriter
+
+
+# Default number of particles of each generated chunk
+CHUNKPARTICLES = 1024**2
+
+
+def uniform(n, boxsize, seed=0, chunksize=CHUNKPARTICLES):
+    """Uniformly distributed particles
+
+    Yields
+    ------
+    numpy.ndarray
+        float32 positions of a chunk, shape (m, 3)
+    """
+
+    rng = np.random.RandomState(seed)
+
+    for begin in range(0, n, chunksize):
+        count = min(chunksize, n - begin)
+        yield (rng.random_sample((count, 3)) * boxsize).astype(np.float32)
+
+
+def lattice(res, boxsize, chunksize=CHUNKPARTICLES):
+    """Particles at the centers of the cells of a res**3 grid, ordered as
+    the initial conditions (index = (ix * res + iy) * res + iz)
+
+    Yields
+    ------
+    numpy.ndarray
+        float32 positions of a chunk, shape (m, 3)
+    """
+
+    n = res**3
+    cell = float(boxsize) / res
+
+    for begin in range(0, n, chunksize):
+        index = np.arange(begin, min(begin + chunksize, n), dtype=np.int64)
+        grid = np.column_stack((index // res**2, (index // res) % res,
+                                index % res))
+        yield ((grid + 0.5) * cell).astype(np.float32)
+
+
+def nfwhalos(n, boxsize, nhalos, rvir, concentration=5.0, fhalo=0.5,
+             seed=0, chunksize=CHUNKPARTICLES):
+    """Particles clustered in NFW halos on top of a uniform background
+
+    Halo centers are uniform in the periodic box and halos get the same
+    number of particles. Radii follow the NFW enclosed mass inside rvir,
+    directions are isotropic.
+
+    Parameters
+    ----------
+    n : int
+        Total number of particles
+    boxsize : float
+    nhalos : int
+    rvir : float or array of float
+        Virial radius of the halos
+    concentration : float or array of float, optional
+    fhalo : float, optional
+        Fraction of the particles in halos
+    seed : int, optional
+    chunksize : int, optional
+
+    Yields
+    ------
+    numpy.ndarray
+        float32 positions of a chunk, shape (m, 3). Halo particles come
+        first, halo by halo
+
+    Examples
+    --------
+    >>> chunks = nfwhalos(10**6, 100.0, nhalos=100, rvir=1.0)
+    >>> writesynthetic('/path/to/snapshot', chunks, 10**6, 100.0)
+    """
+
+    rng = np.random.RandomState(seed)
+
+    centers = rng.random_sample((nhalos, 3)) * boxsize
+    rvir = np.broadcast_to(np.asarray(rvir, dtype=np.float64), (nhalos,))
+    concentration = np.broadcast_to(
+        np.asarray(concentration, dtype=np.float64), (nhalos,))
+
+    nhaloparts = int(n * fhalo) if nhalos > 0 else 0
+
+    for begin in range(0, n, chunksize):
+        end = min(begin + chunksize, n)
+        positions = np.empty((end - begin, 3))
+
+        # Halo particles of the chunk, particle i belongs to halo
+        # i * nhalos // nhaloparts
+        inhalos = max(min(end, nhaloparts) - begin, 0)
+        if inhalos > 0:
+            halo = np.arange(begin, begin + inhalos) * nhalos // nhaloparts
+            radii = _nfwradii(rng.random_sample(inhalos),
+                              concentration[halo]) * rvir[halo]
+            positions[:inhalos] = centers[halo] \
+                                  + radii[:, None] * _directions(rng, inhalos)
+
+        positions[inhalos:] = rng.random_sample((end - begin - inhalos, 3)) \
+                              * boxsize
+
+        yield (positions % boxsize).astype(np.float32)
+
+
+def writesynthetic(path, chunks, n, boxsize, mass=1.0, **kwargs):
+    """Writing generated positions as the halo (dark matter) particles of a
+    Gadget snapshot, with zero velocities and consecutive ids
+
+    Parameters
+    ----------
+    path : str
+    chunks : iterable of numpy.ndarray
+        e.g. uniform(n, boxsize)
+    n : int
+        Total number of particles of chunks
+    boxsize : float
+    mass : float, optional
+        Mass of the particles
+    **kwargs
+        Arguments of GadgetWriter, e.g. numfiles=4, snapformat=2
+
+    Examples
+    --------
+    >>> from mytools.simulation.synthetic import lattice, writesynthetic
+    >>> writesynthetic('/path/to/snapshot', lattice(256, 100.0), 256**3,
+    ...                100.0, snapformat=2, numfiles=8)
+    """
+
+    if n >= 2**32:
+        kwargs.setdefault('idtype', np.uint64)
+
+    with GadgetWriter(path, {'halo': n}, {'halo': mass}, boxsize=boxsize,
+                      **kwargs) as writer:
+        for positions in chunks:
+            writer.write('halo', positions)
+
+
+def _nfwradii(u, concentration):
+    """Radii (in units of rvir) of NFW particles from uniform numbers,
+    inverting the enclosed mass on a table"""
+
+    x = np.logspace(-4, 0, 512)
+    radii = np.empty(len(u))
+
+    for c in np.unique(concentration):
+        mine = concentration == c
+        mass = _nfwmass(x * c) / _nfwmass(c)
+        radii[mine] = np.interp(u[mine], mass, x)
+
+    return radii
+
+
+def _nfwmass(x):
+    """Enclosed NFW mass (up to a constant) within x = r / r_s"""
+
+    return np.log1p(x) - x / (1.0 + x)
+
+
+def _directions(rng, n):
+    """Isotropic unit vectors"""
+
+    cost = rng.random_sample(n) * 2.0 - 1.0
+    phi = rng.random_sample(n) * 2.0 * np.pi
+    sint = np.sqrt(1.0 - cost**2)
+
+    return np.column_stack((sint * np.cos(phi), sint * np.sin(phi), cost))